@@ -61,9 +61,11 @@ async function callSbert(endpoint, body, maxRetries = 3) {
  * @param {string} studentAnswer  - The student's answer
  * @param {string} correctAnswer  - The teacher's correct answer
  * @param {number} [threshold=0.75] - Similarity threshold for pass/fail
+ * @param {{ quizId?, questionId? }} [ref] - Lets the service reuse the reference
+ *        embeddings pinned by prepareQuizForGrading()
  * @returns {Promise<{ isCorrect: boolean, similarityScore: number, explanation: string }>}
  */
-async function gradeAnswerWithAI(questionText, studentAnswer, correctAnswer, threshold = 0.75) {
+async function gradeAnswerWithAI(questionText, studentAnswer, correctAnswer, threshold = 0.75, ref = {}) {
   console.log('\n🤖 Grading started');
   console.log('  Question :', questionText);
   console.log('  Student  :', studentAnswer);
@@ -95,6 +97,8 @@ async function gradeAnswerWithAI(questionText, studentAnswer, correctAnswer, thr
     studentAnswer,
     correctAnswer,
     threshold,
+    quizId: ref.quizId,
+    questionId: ref.questionId,
   });
 
   if (data.error) {
@@ -132,6 +136,29 @@ async function gradeMultipleAnswers(answers, threshold = 0.75) {
   return results;
 }
 
+/**
+ * Precompute the reference side of every question of a quiz in the SBERT
+ * service (POST /prepare), so grading only has to encode student answers.
+ * Fire-and-forget: grading still works without it, just slower.
+ *
+ * @param {{ id, questions, correctAnswers }} quiz
+ */
+async function prepareQuizForGrading(quiz) {
+  try {
+    const questions = (quiz.questions || []).map(q => ({
+      questionId: q.id,
+      questionText: q.text || q.questionText || '',
+      correctAnswer: quiz.correctAnswers?.find(ca => ca.questionId === q.id)?.answer || '',
+    }));
+    if (questions.length === 0) return;
+
+    const data = await callSbert('/prepare', { quizId: quiz.id, questions }, 1);
+    console.log(`✅ SBERT prepared quiz ${quiz.id}: ${data.prepared} questions`);
+  } catch (err) {
+    console.log(`⚠️ SBERT prepare failed for quiz ${quiz.id}: ${err.message}`);
+  }
+}
+
 /**
  * Warm up the SBERT service (fire-and-forget).
  * Call this on backend startup to reduce first-request cold-start latency.
@@ -149,5 +176,6 @@ async function warmupSbert() {
 module.exports = {
   gradeAnswerWithAI,
   gradeMultipleAnswers,
+  prepareQuizForGrading,
   warmupSbert,
 };
@@ -2,6 +2,7 @@ const QuizEvent = require('../models/QuizEvent');
 const QuizAttempt = require('../models/QuizAttempt');
 const Quiz = require('../models/Quiz.prisma');
 const { saveBase64Image, isDataUri } = require('../utils/imageUtils');
+const { prepareQuizForGrading } = require('./gradeController');
 
 // Create a new quiz
 exports.createQuiz = async (req, res) => {
@@ -105,6 +106,9 @@ exports.createQuiz = async (req, res) => {
     });
 
     console.log('Quiz created successfully:', quiz.id);
+
+    // Pin reference-answer embeddings in the SBERT service (not awaited)
+    prepareQuizForGrading(quiz);
     
     res.json({ 
       msg: 'Quiz created successfully',
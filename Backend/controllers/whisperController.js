@@ -1,10 +1,32 @@
 const fs = require('fs');
 const FormData = require('form-data');
 const axios = require('axios');
+const Quiz = require('../models/Quiz.prisma');
 
 // Whisper service URL - can be configured via environment variable
 const WHISPER_SERVICE_URL = process.env.WHISPER_SERVICE_URL || 'http://localhost:5000';
 
+/**
+ * Question text and expected answer for a quiz question, so the Whisper
+ * service can prime the decoder with the question's vocabulary.
+ * Returns {} when the ids are missing or do not match a question.
+ */
+async function questionVocabulary(quizId, questionId) {
+  if (!quizId || questionId === undefined) return {};
+  try {
+    const quiz = await Quiz.findById(parseInt(quizId, 10));
+    const question = (quiz?.questions || []).find(q => String(q.id) === String(questionId));
+    if (!question) return {};
+    return {
+      questionText: question.text || question.questionText || '',
+      correctAnswer: quiz.correctAnswers?.find(ca => String(ca.questionId) === String(questionId))?.answer || '',
+    };
+  } catch (err) {
+    console.error('Could not load question vocabulary:', err.message);
+    return {};
+  }
+}
+
 // POST /api/whisper/transcribe
 exports.transcribe = async (req, res) => {
   try {
@@ -23,6 +45,10 @@ exports.transcribe = async (req, res) => {
     });
     formData.append('language', 'en'); // Force English to prevent hallucinations
 
+    const { questionText, correctAnswer } = await questionVocabulary(req.body.quizId, req.body.questionId);
+    if (questionText) formData.append('questionText', questionText);
+    if (correctAnswer) formData.append('correctAnswer', correctAnswer);
+
     try {
       // Send request to the dockerized Whisper service
       const response = await axios.post(`${WHISPER_SERVICE_URL}/transcribe`, formData, {
@@ -45,6 +71,11 @@ exports.transcribe = async (req, res) => {
       
       const transcription = response.data.text ? response.data.text.trim() : "";
       
+      // The service runs an energy gate + VAD before decoding and flags silent clips
+      if (response.data.noSpeech) {
+        return res.status(400).json({ error: 'No speech detected. Your microphone might be muted or not picking up sound.' });
+      }
+      
       if (audioFile.size < 5000) {
         return res.status(400).json({ error: 'Audio file too small. Your microphone might be muted or not picking up sound.' });
       }
@@ -53,8 +84,13 @@ exports.transcribe = async (req, res) => {
         return res.status(400).json({ error: 'Whisper detected silence. Please ensure your microphone is picking up your voice.' });
       }
 
-      // Return the transcription text
-      res.json({ text: transcription });
+      // Return the transcription text with Whisper's confidence, so grading can flag shaky audio
+      res.json({
+        text: transcription,
+        avgLogprob: response.data.avgLogprob,
+        noSpeechProb: response.data.noSpeechProb,
+        lowConfidence: response.data.lowConfidence
+      });
 
     } catch (error) {
       // Clean up uploaded file
@@ -45,7 +45,8 @@ const initializeGradingWorker = (io) => {
           question.text || question.questionText,
           answerObj.studentAnswer,
           correctAnswerText,
-          0.70
+          0.70,
+          { quizId: quiz.id, questionId: question.id }
         );
 
         const maxPoints = question.points || 10;
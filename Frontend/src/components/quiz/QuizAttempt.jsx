@@ -97,6 +97,12 @@ const QuizAttempt = ({ quiz, onSubmit, onCancel }) => {
     const formData = new FormData();
     const ext = mimeType.includes('mp4') ? 'mp4' : mimeType.includes('mpeg') ? 'mpeg' : mimeType.includes('wav') ? 'wav' : 'webm';
     formData.append('audio', audioBlob, `recording.${ext}`);
+    // Lets the backend prompt Whisper with this question's vocabulary
+    const questionId = quiz.questions?.[currentQuestionIndex]?.id;
+    if (quiz.id && questionId !== undefined) {
+      formData.append('quizId', quiz.id);
+      formData.append('questionId', questionId);
+    }
 
     try {
       const response = await fetch(`${import.meta.env.VITE_API_URL}/api/whisper/transcribe`, {
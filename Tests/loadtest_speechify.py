@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Speechify SBERT Grading Service — Load Test
+============================================
+Replays the labeled TEST_CASES from eval_speechify.py against a running
+sbert-service under load, to size workers/threads before exam week.
+eval_speechify.py measures accuracy and a handful of sequential calls; this
+script measures what happens when many students submit at once.
+
+HOW TO RUN
+----------
+1. Start the SBERT service the way it runs in production, e.g.:
+     cd sbert-service
+     gunicorn --preload --worker-class gthread --threads 8 -w 2 --bind 0.0.0.0:5002 app:app
+   (or `docker compose up sbert-service`)
+
+2. In another terminal (standard library only, no pip install needed):
+     python loadtest_speechify.py                          # closed loop, 1/4/16 users
+     python loadtest_speechify.py --rates 5,10,20,40       # open loop, req/s
+     python loadtest_speechify.py --concurrency 8 --batch-size 20 --label threads-8
+     python loadtest_speechify.py --compare speechify_loadtest_report.json
+
+3. It writes speechify_loadtest_report.json (every level's histogram, RSS
+   samples and timeline) and loadtest_report.md. With --compare, the
+   Markdown also puts an earlier report next to this run level by level.
+
+WHAT THIS MEASURES
+-------------------
+- Closed loop (--concurrency): N simulated users, each sending its next
+  request as soon as the previous one returns. Shows peak throughput.
+- Open loop (--rates): requests are sent on a fixed schedule (or Poisson
+  with --poisson) whether or not earlier ones have returned. Latency is
+  measured from the *scheduled* send time, so a stalled server shows up as
+  latency instead of silently lowering the request rate (no coordinated
+  omission). Shows latency at a given exam-time load.
+- Per level: throughput, error and timeout rates, an HDR-style latency
+  histogram (p50 ... p99.9, max) and the server's RSS over time, polled from
+  /health ("memory"; one sample comes from whichever worker answers).
+
+The corpus is TEST_CASES scaled up with --variants light rewordings of each
+student answer ("I think ...", "The answer is ..."), so the service's
+embedding cache does not turn the run into a cache benchmark.
+"""
+
+import argparse
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen, Request
+
+from eval_speechify import SBERT_URL, THRESHOLD, TEST_CASES
+
+OUT_JSON = "speechify_loadtest_report.json"
+OUT_MD = "loadtest_report.md"
+
+VARIANT_TEMPLATES = [
+    "{}",
+    "I think {}",
+    "The answer is {}",
+    "{}, I believe",
+    "I'm fairly sure it's {}",
+    "Well, {}",
+    "My answer: {}",
+    "{} is what I remember",
+    "So basically {}",
+    "{} if I recall correctly",
+]
+
+REPORTED_PERCENTILES = [50, 75, 90, 95, 99, 99.9]
+
+
+# ---------------------------------------------------------------------------
+# CORPUS
+# ---------------------------------------------------------------------------
+def build_corpus(variants):
+    """TEST_CASES as /grade payloads, each non-empty answer in `variants` wordings."""
+    items = []
+    for question, correct, student, gold, category in TEST_CASES:
+        wordings = VARIANT_TEMPLATES[:variants] if student.strip() else ["{}"]
+        for template in wordings:
+            items.append({"questionText": question, "correctAnswer": correct,
+                          "studentAnswer": template.format(student), "category": category})
+    return items
+
+
+# ---------------------------------------------------------------------------
+# HDR-STYLE LATENCY HISTOGRAM
+# ---------------------------------------------------------------------------
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in microseconds, after HdrHistogram.
+
+    Every power-of-two range is split into 2**SUB_BUCKET_BITS linear
+    buckets, so any value is stored with < 1% relative error from 1 us to
+    hours, in memory proportional to the spread of values rather than to
+    the number of requests. Percentiles report the bucket's highest value.
+    """
+
+    SUB_BUCKET_BITS = 8
+
+    def __init__(self):
+        self.counts = Counter()
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, seconds):
+        value = max(1, int(seconds * 1_000_000))
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        self.counts[(shift, value >> shift)] += 1
+        self.count += 1
+        self.total_us += value
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+        self.max_us = max(self.max_us, value)
+
+    @staticmethod
+    def bucket_top(bucket):
+        shift, sub = bucket
+        return ((sub + 1) << shift) - 1
+
+    def percentile(self, q):
+        """Latency in ms at or below which q% of the recorded values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.bucket_top(bucket), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "min_ms": round((self.min_us or 0) / 1000, 3),
+            "mean_ms": round(self.total_us / self.count / 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max_us / 1000, 3),
+            "percentiles_ms": {f"p{q:g}": round(self.percentile(q), 3) for q in REPORTED_PERCENTILES},
+            # [bucket upper bound in ms, count], enough to re-plot or merge runs
+            "buckets": [[round(self.bucket_top(b) / 1000, 3), self.counts[b]] for b in sorted(self.counts)],
+        }
+
+
+# ---------------------------------------------------------------------------
+# REQUESTS
+# ---------------------------------------------------------------------------
+def send(payload, path, timeout):
+    """POST one request; returns (outcome, status) with outcome ok/http_error/timeout/connection_error."""
+    req = Request(f"{SBERT_URL}{path}", data=json.dumps(payload).encode(),
+                  headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urlopen(req, timeout=timeout) as r:
+            r.read()
+            return "ok", r.status
+    except HTTPError as e:
+        return "http_error", e.code
+    except (socket.timeout, TimeoutError):
+        return "timeout", None
+    except URLError as e:
+        if isinstance(e.reason, (socket.timeout, TimeoutError)):
+            return "timeout", None
+        return "connection_error", None
+
+
+def make_payload(corpus, rng, batch_size):
+    if batch_size:
+        answers = [{k: v for k, v in it.items() if k != "category"} for it in rng.sample(corpus, batch_size)]
+        return "/batch-grade", {"threshold": THRESHOLD, "answers": answers}
+    item = rng.choice(corpus)
+    return "/grade", {**{k: v for k, v in item.items() if k != "category"}, "threshold": THRESHOLD}
+
+
+class RssPoller:
+    """Polls /health every `interval` s and keeps (t, pid, rssMb) samples."""
+
+    def __init__(self, interval, start):
+        self.interval = interval
+        self.start = start
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            try:
+                with urlopen(f"{SBERT_URL}/health", timeout=5) as r:
+                    memory = json.loads(r.read()).get("memory") or {}
+                if memory.get("rssMb") is not None:
+                    self.samples.append({"t": round(time.perf_counter() - self.start, 2),
+                                         "pid": memory.get("pid"), "rssMb": memory["rssMb"]})
+            except (URLError, OSError, ValueError):
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------------------------------------------------------------------------
+# LOAD LEVELS
+# ---------------------------------------------------------------------------
+def run_closed_loop(corpus, concurrency, args):
+    """`concurrency` users sending back-to-back for args.duration seconds."""
+    results = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    def user(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            path, payload = make_payload(corpus, rng, args.batch_size)
+            sent = time.perf_counter()
+            outcome, status = send(payload, path, args.timeout)
+            done = time.perf_counter()
+            results.append((sent - start, done - sent, done - start, outcome, status))
+
+    with RssPoller(args.rss_interval, start) as rss:
+        threads = [threading.Thread(target=user, args=(args.seed * 1000 + i,)) for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return results, time.perf_counter() - start, rss.samples
+
+
+def run_open_loop(corpus, rate, args):
+    """rate req/s for args.duration seconds; latency counted from the scheduled send time."""
+    rng = random.Random(args.seed)
+    results = []
+    start = time.perf_counter()
+
+    def fire(scheduled, path, payload):
+        outcome, status = send(payload, path, args.timeout)
+        done = time.perf_counter()
+        results.append((scheduled - start, done - scheduled, done - start, outcome, status))
+
+    with RssPoller(args.rss_interval, start) as rss, ThreadPoolExecutor(max_workers=args.max_inflight) as pool:
+        scheduled = start
+        while scheduled < start + args.duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            path, payload = make_payload(corpus, rng, args.batch_size)
+            pool.submit(fire, scheduled, path, payload)
+            scheduled += rng.expovariate(rate) if args.poisson else 1 / rate
+    return results, time.perf_counter() - start, rss.samples
+
+
+def summarize(kind, level, results, wall, rss_samples, args):
+    histogram = LatencyHistogram()
+    outcomes = Counter(r[3] for r in results)
+    statuses = Counter(str(r[4]) for r in results if r[3] == "http_error")
+    timeline = {}
+    for _, latency, done_at, outcome, _ in results:
+        if outcome == "ok":
+            histogram.record(latency)
+        second = timeline.setdefault(int(done_at), {"t": int(done_at), "ok": 0, "failed": 0})
+        second["ok" if outcome == "ok" else "failed"] += 1
+
+    n = len(results)
+    answers_per_request = args.batch_size or 1
+    peak_by_pid = {}
+    for sample in rss_samples:
+        peak_by_pid[sample["pid"]] = max(peak_by_pid.get(sample["pid"], 0), sample["rssMb"])
+    return {
+        "mode": kind,
+        "level": level,
+        "requests": n,
+        "ok": outcomes["ok"],
+        "error_rate": round((outcomes["http_error"] + outcomes["connection_error"]) / n, 4) if n else 0.0,
+        "timeout_rate": round(outcomes["timeout"] / n, 4) if n else 0.0,
+        "outcomes": dict(outcomes),
+        "http_statuses": dict(statuses),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(outcomes["ok"] / wall, 2) if wall else 0.0,
+        "answers_per_second": round(outcomes["ok"] * answers_per_request / wall, 2) if wall else 0.0,
+        "latency": histogram.to_dict(),
+        "server_rss": {
+            "peak_mb_by_pid": peak_by_pid,
+            "max_mb": max(peak_by_pid.values()) if peak_by_pid else None,
+            "samples": rss_samples,
+        },
+        "timeline": [timeline[k] for k in sorted(timeline)],
+    }
+
+
+# ---------------------------------------------------------------------------
+# REPORTS
+# ---------------------------------------------------------------------------
+def level_key(level):
+    return f"{level['mode']}:{level['level']}"
+
+
+def level_name(level):
+    return f"{level['level']} users" if level["mode"] == "closed" else f"{level['level']:g} req/s"
+
+
+def write_markdown_report(report, previous):
+    lines = [
+        f"# SBERT Grading Service — Load Test ({report['label']})",
+        "",
+        f"{report['timestamp']} against `{report['url']}`: {report['corpus_size']} answers "
+        f"({report['n_test_cases']} test cases x up to {report['variants']} wordings), "
+        f"{report['duration_seconds']} s per level, "
+        + (f"/batch-grade with {report['batch_size']} answers per request." if report["batch_size"]
+           else "/grade with one answer per request."),
+        "",
+        "| Load | Requests | Throughput (req/s) | Errors | Timeouts | p50 ms | p90 ms | p99 ms | p99.9 ms | max ms | Server RSS MB |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for level in report["levels"]:
+        p = level["latency"]["percentiles_ms"]
+        rss = level["server_rss"]["max_mb"]
+        lines.append(
+            f"| {level_name(level)} | {level['requests']} | {level['throughput_rps']} "
+            f"| {level['error_rate']:.1%} | {level['timeout_rate']:.1%} | {p['p50']} | {p['p90']} "
+            f"| {p['p99']} | {p['p99.9']} | {level['latency']['max_ms']} | {rss if rss is not None else '-'} |"
+        )
+
+    for old in previous:
+        old_levels = {level_key(level): level for level in old["levels"]}
+        lines += [
+            "",
+            f"## Compared with {old['label']} ({old['timestamp']})",
+            "",
+            "| Load | Throughput (req/s) | p50 ms | p99 ms | Errors + timeouts | Server RSS MB |",
+            "|---|---|---|---|---|---|",
+        ]
+        for level in report["levels"]:
+            before = old_levels.get(level_key(level))
+            if before is None:
+                continue
+            lines.append(
+                f"| {level_name(level)} "
+                f"| {before['throughput_rps']} → {level['throughput_rps']} ({change(before['throughput_rps'], level['throughput_rps'])}) "
+                f"| {before['latency']['percentiles_ms']['p50']} → {level['latency']['percentiles_ms']['p50']} "
+                f"({change(before['latency']['percentiles_ms']['p50'], level['latency']['percentiles_ms']['p50'])}) "
+                f"| {before['latency']['percentiles_ms']['p99']} → {level['latency']['percentiles_ms']['p99']} "
+                f"({change(before['latency']['percentiles_ms']['p99'], level['latency']['percentiles_ms']['p99'])}) "
+                f"| {before['error_rate'] + before['timeout_rate']:.1%} → {level['error_rate'] + level['timeout_rate']:.1%} "
+                f"| {before['server_rss']['max_mb']} → {level['server_rss']['max_mb']} |"
+            )
+
+    lines += [
+        "",
+        "Latency percentiles come from an HDR-style log-linear histogram (< 1% error) of",
+        "successful requests only; open-loop latency is measured from the scheduled send",
+        "time. Server RSS is polled from /health, so with several gunicorn workers each",
+        "sample is whichever worker answered (per-worker peaks are in the JSON report).",
+        "",
+    ]
+    with open(OUT_MD, "w") as f:
+        f.write("\n".join(lines))
+    print(f"\nMarkdown report written to {OUT_MD}")
+
+
+def change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def check_service_alive():
+    try:
+        with urlopen(f"{SBERT_URL}/health", timeout=5) as r:
+            data = json.loads(r.read())
+            print(f"✓ SBERT service is alive: {data.get('status')} "
+                  f"(backend {data.get('backend')}, memory {data.get('memory')})\n")
+            return True
+    except URLError as e:
+        print(f"✗ Could not reach {SBERT_URL}/health — is the service running?")
+        print(f"  Error: {e}")
+        return False
+
+
+def main():
+    global SBERT_URL
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=SBERT_URL)
+    parser.add_argument("--concurrency", default=None,
+                        help="closed-loop levels, comma-separated users (default: 1,4,16 when no --rates)")
+    parser.add_argument("--rates", default=None, help="open-loop levels, comma-separated req/s")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per level")
+    parser.add_argument("--variants", type=int, default=5, help=f"wordings per answer (max {len(VARIANT_TEMPLATES)})")
+    parser.add_argument("--batch-size", type=int, default=0, help="send /batch-grade with N answers")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--max-inflight", type=int, default=256, help="open-loop client threads")
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="seconds between /health polls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="current", help="name of this run in reports")
+    parser.add_argument("--compare", nargs="*", default=[], metavar="REPORT",
+                        help="earlier JSON reports to compare against in the Markdown")
+    args = parser.parse_args()
+    SBERT_URL = args.url.rstrip("/")
+
+    previous = []
+    for path in args.compare:
+        with open(path) as f:
+            previous.append(json.load(f))
+
+    if not check_service_alive():
+        sys.exit(1)
+
+    corpus = build_corpus(min(args.variants, len(VARIANT_TEMPLATES)))
+    plan = [("open", float(r)) for r in args.rates.split(",")] if args.rates else []
+    if args.concurrency or not plan:
+        plan = [("closed", int(c)) for c in (args.concurrency or "1,4,16").split(",")] + plan
+
+    print(f"{len(corpus)} answers, {args.duration:g} s per level, "
+          + (f"/batch-grade x{args.batch_size}" if args.batch_size else "/grade") + "\n")
+    print(f"  {'Load':<14}  {'req':>6}  {'req/s':>7}  {'err':>6}  {'tmo':>6}  {'p50 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  {'RSS MB':>7}")
+    print(f"  {'-'*14}  {'-'*6}  {'-'*7}  {'-'*6}  {'-'*6}  {'-'*8}  {'-'*8}  {'-'*8}  {'-'*7}")
+    levels = []
+    for kind, level in plan:
+        runner = run_closed_loop if kind == "closed" else run_open_loop
+        results, wall, rss_samples = runner(corpus, level, args)
+        summary = summarize(kind, level, results, wall, rss_samples, args)
+        levels.append(summary)
+        p = summary["latency"]["percentiles_ms"]
+        rss = summary["server_rss"]["max_mb"]
+        print(f"  {level_name(summary):<14}  {summary['requests']:>6}  {summary['throughput_rps']:>7.2f}  "
+              f"{summary['error_rate']:>6.1%}  {summary['timeout_rate']:>6.1%}  {p['p50']:>8.1f}  "
+              f"{p['p99']:>8.1f}  {summary['latency']['max_ms']:>8.1f}  {rss if rss is not None else '-':>7}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "label": args.label,
+        "url": SBERT_URL,
+        "n_test_cases": len(TEST_CASES),
+        "variants": min(args.variants, len(VARIANT_TEMPLATES)),
+        "corpus_size": len(corpus),
+        "threshold_used": THRESHOLD,
+        "batch_size": args.batch_size,
+        "duration_seconds": args.duration,
+        "timeout_seconds": args.timeout,
+        "poisson": args.poisson,
+        "levels": levels,
+    }
+    with open(OUT_JSON, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nFull raw report: {OUT_JSON}")
+    write_markdown_report(report, previous)
+
+
+if __name__ == "__main__":
+    main()
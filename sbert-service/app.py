@@ -1,12 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
 import torch
 import logging
+import json
 import os
 import re
 import math
+import bisect
+import gc
+import sys
+import queue
+import resource
+import time
+import hashlib
+import threading
 import unicodedata
+from collections import Counter, OrderedDict
 
 # Memory optimizations for Render free tier (512MB RAM)
 os.environ["OMP_NUM_THREADS"] = "1"
@@ -14,41 +24,273 @@ os.environ["MKL_NUM_THREADS"] = "1"
 torch.set_num_threads(1)
 torch.set_grad_enabled(False)
 
-logging.basicConfig(level=logging.INFO)
+# Per-answer trace lines are DEBUG; SBERT_LOG_LEVEL=DEBUG turns them on.
+logging.basicConfig(level=os.environ.get("SBERT_LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
 
-# Global model — lazy loaded on first request
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Inference backend for the same model:
+#   torch      — PyTorch (default)
+#   onnx       — ONNX Runtime, fp32 export
+#   onnx-int8  — ONNX Runtime, dynamically quantized int8 weights (~4x smaller)
+# Embeddings must stay within BACKEND_COSINE_TOLERANCE of the torch path, i.e.
+# cos(torch_emb, backend_emb) >= 1 - tolerance for every sentence
+# (checked by `python grading_eval.py --compare-backends`).
+SBERT_BACKEND = os.environ.get("SBERT_BACKEND", "torch").lower()
+ONNX_INT8_FILE = os.environ.get("SBERT_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+BACKEND_COSINE_TOLERANCE = {"torch": 0.0, "onnx": 1e-4, "onnx-int8": 0.02}
+
+# Global model — lazy loaded on first request, or at import when SBERT_EAGER_LOAD=1.
+# With `gunicorn --preload` the import happens in the master before fork, so
+# every worker shares the weight pages copy-on-write instead of loading its own.
 _model = None
+MODEL_LOAD_SECONDS = None
+EAGER_LOAD = os.environ.get("SBERT_EAGER_LOAD", "0") == "1"
+
+# Max sentences per forward pass when /batch-grade encodes a whole quiz at once
+ENCODE_BATCH_SIZE = int(os.environ.get("SBERT_ENCODE_BATCH_SIZE", "64"))
+
+# Items encoded per forward pass when /batch-grade streams NDJSON results
+STREAM_CHUNK_SIZE = int(os.environ.get("SBERT_STREAM_CHUNK_SIZE", "16"))
+
+# Context-aware SBERT channel ("Question: ... Answer: ..." strings, 40% weight).
+# Disabling it halves encoder work; requests can override with `contextAware`.
+CONTEXT_CHANNEL_ENABLED = os.environ.get("SBERT_CONTEXT_CHANNEL", "1") != "0"
+
+# Calibration table written by threshold_sweep.py; when set, every result also
+# carries `calibratedScore` (estimated probability a human grader passes it).
+CALIBRATION_FILE = os.environ.get("SBERT_CALIBRATION_FILE")
 
 def get_model():
-    global _model
+    global _model, MODEL_LOAD_SECONDS
     if _model is None:
-        logger.info("Loading SBERT model...")
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("SBERT model loaded.")
+        logger.info(f"Loading SBERT model ({SBERT_BACKEND} backend)...")
+        t0 = time.perf_counter()
+        model = load_model(SBERT_BACKEND)
+        # Warmup inference: first-call allocations and tokenizer setup happen
+        # here (pre-fork when preloading) instead of on a student's request.
+        model.encode(["warmup", context_text("warmup question", "warmup answer")])
+        MODEL_LOAD_SECONDS = round(time.perf_counter() - t0, 3)
+        _model = model
+        logger.info(f"SBERT model loaded and warm in {MODEL_LOAD_SECONDS}s.")
     return _model
 
 
+def load_model(backend: str) -> SentenceTransformer:
+    """Load MODEL_NAME on the given inference backend (see SBERT_BACKEND)."""
+    if backend == "torch":
+        return SentenceTransformer(MODEL_NAME)
+    if backend not in ("onnx", "onnx-int8"):
+        raise ValueError(f"Unknown SBERT_BACKEND '{backend}' (expected torch, onnx or onnx-int8)")
+
+    # Imported here so the torch backend does not need onnxruntime installed
+    import onnxruntime
+
+    # Same single-threaded budget as torch.set_num_threads(1) above
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = 1
+    session_options.inter_op_num_threads = 1
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+    model_kwargs["file_name"] = ONNX_INT8_FILE if backend == "onnx-int8" else "onnx/model.onnx"
+    return SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs=model_kwargs)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# METRICS
+# ──────────────────────────────────────────────────────────────────────────────
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class Histogram:
+    """Bucketed observations, rendered as a Prometheus histogram (cumulative `le` buckets)."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        lines, cumulative = [], 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        braces = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{braces} {self.sum:.6f}")
+        lines.append(f"{name}_count{braces} {self.count}")
+        return lines
+
+
+class GradingMetrics:
+    """
+    Counters and histograms behind GET /metrics (Prometheus text format).
+
+    Grading code records into this object as it runs: the layer that decided
+    each grade, the guards that shaped each blended score, time spent in the
+    cheap layers, the encoder and the guards, and encoder batch sizes. Cache,
+    micro-batching and model state are read from their own objects at scrape
+    time. Values are per process: with several gunicorn workers each scrape
+    is answered by one of them (the `pid` label tells them apart).
+    """
+
+    STAGES = {
+        "preprocess": ("sbert_preprocess_seconds", "Layers 0-4 per answer", LATENCY_BUCKETS),
+        "encode": ("sbert_encode_seconds", "Encoder call per grade or batch chunk, incl. micro-batch wait", LATENCY_BUCKETS),
+        "forward": ("sbert_forward_seconds", "Model forward pass over uncached sentences", LATENCY_BUCKETS),
+        "guards": ("sbert_guards_seconds", "Layer 6 (blend and guards A-E) per answer", LATENCY_BUCKETS),
+        "forward_sentences": ("sbert_forward_batch_sentences", "Sentences per model forward pass", SIZE_BUCKETS),
+        "batch_answers": ("sbert_batch_grade_answers", "Answers per /batch-grade request", SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decisions = Counter()
+        self.guards = Counter()
+        self.requests = Counter()
+        self.request_seconds = {}
+        self.histograms = {stage: Histogram(buckets) for stage, (_, _, buckets) in self.STAGES.items()}
+
+    def count_decision(self, layer: str) -> None:
+        with self._lock:
+            self.decisions[layer] += 1
+
+    def count_guards(self, guards: list) -> None:
+        with self._lock:
+            self.guards.update(guards)
+
+    def observe(self, stage: str, value: float) -> None:
+        with self._lock:
+            self.histograms[stage].observe(value)
+
+    def observe_request(self, endpoint: str, status: int, seconds: float) -> None:
+        with self._lock:
+            self.requests[(endpoint, status)] += 1
+            self.request_seconds.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(seconds)
+
+    def render(self) -> str:
+        pid = f'pid="{os.getpid()}"'
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                out.append(f"{name}{{{pid}{',' + labels if labels else ''}}} {value}")
+
+        with self._lock:
+            metric("sbert_grades_total", "counter", "Grades by the layer that decided them",
+                   [(f'layer="{layer}"', n) for layer, n in sorted(self.decisions.items())])
+            metric("sbert_guards_total", "counter", "Layer 6 guards applied (A-E, or normal blend)",
+                   [(f'guard="{guard}"', n) for guard, n in sorted(self.guards.items())])
+            metric("sbert_http_requests_total", "counter", "HTTP requests by endpoint and status",
+                   [(f'endpoint="{e}",status="{c}"', n) for (e, c), n in sorted(self.requests.items())])
+            out.append("# HELP sbert_http_request_seconds Request handling time by endpoint")
+            out.append("# TYPE sbert_http_request_seconds histogram")
+            for endpoint, histogram in sorted(self.request_seconds.items()):
+                out.extend(histogram.render("sbert_http_request_seconds", f'{pid},endpoint="{endpoint}"'))
+            for stage, (name, help_text, _) in self.STAGES.items():
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} histogram")
+                out.extend(self.histograms[stage].render(name, pid))
+
+        cache = embedding_cache.stats()
+        metric("sbert_embedding_cache_lookups_total", "counter", "Embedding cache lookups",
+               [('result="hit"', cache["hits"]), ('result="miss"', cache["misses"])])
+        metric("sbert_embedding_cache_evictions_total", "counter", "Embedding cache LRU evictions",
+               [("", cache["evictions"])])
+        metric("sbert_embedding_cache_entries", "gauge", "Embeddings held", [("", cache["entries"])])
+        metric("sbert_embedding_cache_bytes", "gauge", "Bytes of embeddings held", [("", cache["bytes"])])
+        prepared = prepared_quizzes.stats()
+        metric("sbert_prepared_lookups_total", "counter", "Prepared reference lookups",
+               [('result="hit"', prepared["hits"]), ('result="miss"', prepared["misses"])])
+        metric("sbert_prepared_quizzes", "gauge", "Prepared quizzes held", [("", prepared["quizzes"])])
+        metric("sbert_prepared_bytes", "gauge", "Bytes of prepared references held", [("", prepared["bytes"])])
+        scheduler = inference_scheduler.stats()
+        metric("sbert_microbatch_batches_total", "counter", "Micro-batched encoder passes", [("", scheduler["batches"])])
+        metric("sbert_microbatch_requests_total", "counter", "Requests served by micro-batching",
+               [("", scheduler["requests"])])
+        metric("sbert_model_loaded", "gauge", "1 once the model is loaded and warm", [("", int(_model is not None))])
+        metric("sbert_model_load_seconds", "gauge", "Model load and warmup time",
+               [("", MODEL_LOAD_SECONDS if MODEL_LOAD_SECONDS is not None else "NaN")])
+        memory = process_memory()
+        if memory["rssMb"] is not None:
+            metric("sbert_process_resident_memory_bytes", "gauge", "Resident set size",
+                   [("", int(memory["rssMb"] * 2**20))])
+        return "\n".join(out) + "\n"
+
+
+grading_metrics = GradingMetrics()
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # PRE-PROCESSING HELPERS
 # ──────────────────────────────────────────────────────────────────────────────
 
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_NON_LETTER_RE = re.compile(r"[^a-z]")
+_CONSONANT_RUN_RE = re.compile(r"[^aeiou]{5,}")
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+_NUMERIC_ANSWER_RE = re.compile(r"[-+]?[\d,]+(?:[./]\d+)?")
+
+VOWELS = frozenset("aeiou")
+NEGATION_WORDS = frozenset({"not", "never", "no", "none", "nothing", "isn't", "aren't",
+                            "don't", "doesn't", "won't", "can't", "couldn't", "wouldn't", "shouldn't"})
+
+
 def normalize(text: str) -> str:
     """Lowercase, strip, collapse whitespace."""
     text = unicodedata.normalize("NFKD", text)
-    return re.sub(r"\s+", " ", text.strip().lower())
+    return _WHITESPACE_RE.sub(" ", text.strip().lower())
 
 
 def tokenize(text: str) -> list[str]:
     """Return meaningful word tokens (no punctuation, no single chars)."""
-    tokens = re.findall(r"[a-z0-9]+", normalize(text))
-    return [t for t in tokens if len(t) > 1 or t.isdigit()]
+    return _tokens(normalize(text))
+
 
+def _tokens(normalized: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(normalized) if len(t) > 1 or t.isdigit()]
 
-def is_gibberish(text: str) -> bool:
+
+class PreparedText:
+    """
+    Everything the grading layers derive from one answer string, computed once.
+
+    The layer functions below accept either a raw string or a PreparedText;
+    compute_grade() builds one per input so normalize()/tokenize() run a
+    single time per string instead of once per layer.
+    """
+
+    __slots__ = ("raw", "normalized", "tokens", "token_set", "letters",
+                 "numbers", "has_negation", "is_numeric")
+
+    def __init__(self, text: str):
+        self.raw = text
+        self.normalized = normalize(text)
+        self.tokens = _tokens(self.normalized)
+        self.token_set = set(self.tokens)
+        self.letters = _NON_LETTER_RE.sub("", self.normalized)
+        self.numbers = [float(m) for m in _NUMBER_RE.findall(self.normalized)]
+        self.has_negation = not self.token_set.isdisjoint(NEGATION_WORDS)
+        # Matches things like "4", "-3.5", "1/2", "1,000"
+        self.is_numeric = bool(_NUMERIC_ANSWER_RE.fullmatch(self.normalized.replace(" ", "")))
+
+
+def is_gibberish(text: str | PreparedText) -> bool:
     """
     Detect keysmash / random character strings.
     A string is gibberish if:
@@ -56,11 +298,13 @@ def is_gibberish(text: str) -> bool:
       - Its ratio of vowels to total letters is below 5% AND it has > 4 characters, OR
       - It contains a run of 5+ consecutive consonants
     """
-    letters = re.sub(r"[^a-z]", "", normalize(text))
+    if isinstance(text, PreparedText):
+        letters = text.letters
+    else:
+        letters = _NON_LETTER_RE.sub("", normalize(text))
     if not letters:
         return False  # purely numeric — handled elsewhere
-    vowels = set("aeiou")
-    n_vowels = sum(1 for c in letters if c in vowels)
+    n_vowels = sum(1 for c in letters if c in VOWELS)
     vowel_ratio = n_vowels / len(letters)
 
     # No vowels at all in a long string
@@ -72,28 +316,37 @@ def is_gibberish(text: str) -> bool:
         return True
 
     # Long consonant run (e.g. "kjkjsf", "qwrtyp")
-    if re.search(r"[^aeiou]{5,}", letters):
+    if _CONSONANT_RUN_RE.search(letters):
         return True
 
     return False
 
 
-def extract_numbers(text: str) -> list[float]:
+def extract_numbers(text: str | PreparedText) -> list[float]:
     """Extract all numbers (int or float) from text."""
-    return [float(m) for m in re.findall(r"-?\d+(?:\.\d+)?", text)]
+    if isinstance(text, PreparedText):
+        return text.numbers
+    return [float(m) for m in _NUMBER_RE.findall(text)]
 
 
-def is_numeric_answer(text: str) -> bool:
+def is_numeric_answer(text: str | PreparedText) -> bool:
     """True if the stripped text is essentially just a number (or math expression)."""
+    if isinstance(text, PreparedText):
+        return text.is_numeric
     stripped = normalize(text)
     # Matches things like "4", "-3.5", "1/2", "1,000"
-    return bool(re.fullmatch(r"[-+]?[\d,]+(?:[./]\d+)?", stripped.replace(" ", "")))
+    return bool(_NUMERIC_ANSWER_RE.fullmatch(stripped.replace(" ", "")))
 
 
-def jaccard_similarity(text1: str, text2: str) -> float:
+def jaccard_similarity(text1: str | PreparedText, text2: str | PreparedText) -> float:
     """Word-level Jaccard similarity."""
-    set1 = set(tokenize(text1))
-    set2 = set(tokenize(text2))
+    set1 = text1.token_set if isinstance(text1, PreparedText) else set(tokenize(text1))
+    set2 = text2.token_set if isinstance(text2, PreparedText) else set(tokenize(text2))
+    return jaccard_tokens(set1, set2)
+
+
+def jaccard_tokens(set1: set[str], set2: set[str]) -> float:
+    """Jaccard similarity of two already-tokenized answers."""
     if not set1 and not set2:
         return 1.0
     if not set1 or not set2:
@@ -103,10 +356,15 @@ def jaccard_similarity(text1: str, text2: str) -> float:
     return len(intersection) / len(union)
 
 
-def token_f1(text1: str, text2: str) -> float:
+def token_f1(text1: str | PreparedText, text2: str | PreparedText) -> float:
     """Token-level F1 (SQuAD style) — handles partial overlaps better than Jaccard."""
-    tokens1 = tokenize(text1)
-    tokens2 = tokenize(text2)
+    tokens1 = text1.tokens if isinstance(text1, PreparedText) else tokenize(text1)
+    tokens2 = text2.tokens if isinstance(text2, PreparedText) else tokenize(text2)
+    return f1_tokens(tokens1, tokens2)
+
+
+def f1_tokens(tokens1: list[str], tokens2: list[str]) -> float:
+    """Token-level F1 of two already-tokenized answers."""
     if not tokens1 and not tokens2:
         return 1.0
     if not tokens1 or not tokens2:
@@ -123,7 +381,7 @@ def token_f1(text1: str, text2: str) -> float:
 # NUMERIC GRADING
 # ──────────────────────────────────────────────────────────────────────────────
 
-def grade_numeric(student_answer: str, correct_answer: str) -> dict:
+def grade_numeric(student_answer: str | PreparedText, correct_answer: str | PreparedText) -> dict:
     """
     Strict numeric grading.
     - Exact numeric match → 1.0
@@ -174,20 +432,479 @@ def grade_numeric(student_answer: str, correct_answer: str) -> dict:
 # SBERT SIMILARITY
 # ──────────────────────────────────────────────────────────────────────────────
 
-def sbert_similarity(text1: str, text2: str) -> float:
+class EmbeddingCache:
+    """
+    Bounded LRU cache of sentence embeddings.
+
+    Keys are a hash of the model name and the exact string passed to the
+    encoder, so reference answers and "Question: ... Answer: ..." strings that
+    repeat across every student of a quiz are only encoded once. The cache is
+    capped both by entry count and by the bytes held in embedding tensors;
+    the least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(f"{MODEL_NAME}:{SBERT_BACKEND}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str):
+        k = self.key(text)
+        with self._lock:
+            emb = self._entries.get(k)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(k)
+            self.hits += 1
+            return emb
+
+    def put(self, text: str, emb: torch.Tensor) -> None:
+        if self.max_entries <= 0:
+            return
+        size = emb.element_size() * emb.nelement()
+        if size > self.max_bytes:
+            return
+        k = self.key(text)
+        with self._lock:
+            old = self._entries.pop(k, None)
+            if old is not None:
+                self._bytes -= old.element_size() * old.nelement()
+            self._entries[k] = emb
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.element_size() * evicted.nelement()
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.environ.get("SBERT_CACHE_MAX_ENTRIES", "20000")),
+    max_bytes=int(os.environ.get("SBERT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+)
+
+
+def encode_texts(texts: list[str], pinned: dict | None = None, timings: dict | None = None) -> torch.Tensor:
+    """
+    Embeddings for `texts` (one row per input, in order).
+
+    Strings in `pinned` (precomputed reference embeddings from /prepare) and
+    cached strings are not re-encoded; all misses are encoded together in a
+    single forward pass and then cached.
+
+    When `timings` is given it receives `encoded` (the strings that went
+    through the model), `modelLoadMs` and `forwardMs`.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    found = {}
+    missing = []
+    for t in unique_texts:
+        if pinned and t in pinned:
+            found[t] = pinned[t]
+            continue
+        emb = embedding_cache.get(t)
+        if emb is None:
+            missing.append(t)
+        else:
+            found[t] = emb
+
+    if timings is not None:
+        timings.update(encoded=set(missing), modelLoadMs=0.0, forwardMs=0.0)
+    if missing:
+        t_load = time.perf_counter()
+        m = get_model()
+        t0 = time.perf_counter()
+        encoded = m.encode(missing, convert_to_tensor=True, batch_size=ENCODE_BATCH_SIZE)
+        t1 = time.perf_counter()
+        grading_metrics.observe("forward", t1 - t0)
+        grading_metrics.observe("forward_sentences", len(missing))
+        if timings is not None:
+            timings.update(modelLoadMs=(t0 - t_load) * 1000, forwardMs=(t1 - t0) * 1000)
+        for t, emb in zip(missing, encoded):
+            emb = emb.detach().clone()
+            found[t] = emb
+            embedding_cache.put(t, emb)
+
+    return torch.stack([found[t] for t in texts])
+
+
+class InferenceScheduler:
+    """
+    Micro-batching front end for encode_texts().
+
+    Concurrent requests (gthread workers) submit their texts to a queue; one
+    background thread collects submissions for up to `max_wait_ms` or until
+    `max_batch` sentences are waiting, runs a single batched encode for all
+    of them, and hands each request its rows back. Everything else in the
+    pipeline (layers 0–4, guards) stays on the request thread.
+
+    With max_wait_ms <= 0 the scheduler is bypassed and requests encode inline.
+    """
+
+    def __init__(self, max_wait_ms: float, max_batch: int):
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.sentences = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_wait > 0
+
+    def encode(self, texts: list[str], pinned: dict | None = None, timings: dict | None = None) -> torch.Tensor:
+        """`timings` (optional) also gets `queueWaitMs`: submit → start of the batch's encode."""
+        if not self.enabled:
+            if timings is not None:
+                timings["queueWaitMs"] = 0.0
+            return encode_texts(texts, pinned, timings)
+
+        job = {"texts": texts, "pinned": pinned, "done": threading.Event(),
+               "result": None, "error": None, "timings": timings, "submitted": time.perf_counter()}
+        self._ensure_worker().put(job)
+        job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+    def _ensure_worker(self) -> "queue.Queue":
+        # Threads do not survive fork: each gunicorn worker starts its own.
+        with self._start_lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name="sbert-microbatch", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _run(self, jobs: "queue.Queue") -> None:
+        while True:
+            batch = [jobs.get()]
+            waiting = len(batch[0]["texts"])
+            deadline = time.perf_counter() + self.max_wait
+            while waiting < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    job = jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(job)
+                waiting += len(job["texts"])
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: list[dict]) -> None:
+        texts = []
+        pinned = {}
+        for job in batch:
+            texts.extend(job["texts"])
+            if job["pinned"]:
+                pinned.update(job["pinned"])
+        batch_timings = {} if any(job["timings"] is not None for job in batch) else None
+        started = time.perf_counter()
+        try:
+            embeddings = encode_texts(texts, pinned, batch_timings)
+            start = 0
+            for job in batch:
+                job["result"] = embeddings[start:start + len(job["texts"])]
+                start += len(job["texts"])
+                if job["timings"] is not None:
+                    # Each request waited for the whole forward pass, shared or not
+                    job["timings"].update(batch_timings, queueWaitMs=(started - job["submitted"]) * 1000,
+                                          encoded=batch_timings["encoded"].intersection(job["texts"]))
+        except Exception as e:
+            for job in batch:
+                job["error"] = e
+        finally:
+            self.batches += 1
+            self.requests += len(batch)
+            self.sentences += len(texts)
+            for job in batch:
+                job["done"].set()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "maxWaitMs": round(self.max_wait * 1000, 3),
+            "maxBatch": self.max_batch,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avgRequestsPerBatch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "avgSentencesPerBatch": round(self.sentences / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+# Micro-batching only pays off when a worker serves concurrent requests
+# (gunicorn --worker-class gthread --threads N); it is off by default.
+inference_scheduler = InferenceScheduler(
+    max_wait_ms=float(os.environ.get("SBERT_MICROBATCH_WAIT_MS", "0")),
+    max_batch=int(os.environ.get("SBERT_MICROBATCH_MAX_SENTENCES", "64")),
+)
+
+
+def sbert_similarity(text1: str, text2: str, pinned: dict | None = None) -> float:
     """Raw cosine similarity from SBERT."""
-    m = get_model()
-    emb1 = m.encode(text1, convert_to_tensor=True)
-    emb2 = m.encode(text2, convert_to_tensor=True)
-    score = float(util.pytorch_cos_sim(emb1, emb2)[0][0])
-    return max(0.0, min(1.0, score))
+    return sbert_pair_similarities([(text1, text2)], pinned)[0]
+
+
+def sbert_pair_similarities(pairs: list[tuple[str, str]], pinned: dict | None = None,
+                            timings: dict | None = None) -> list[float]:
+    """
+    Clamped cosine similarity for many (text1, text2) pairs with ONE encode call.
+
+    Identical strings (e.g. the same reference answer across students) are
+    encoded once; the pairwise cosines are computed as a single vectorized op.
+    `timings` is filled as by InferenceScheduler.encode().
+    """
+    if not pairs:
+        return []
+    n = len(pairs)
+    embeddings = inference_scheduler.encode([a for a, _ in pairs] + [b for _, b in pairs], pinned, timings)
+    embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+    scores = (embeddings[:n] * embeddings[n:]).sum(dim=1).clamp(0.0, 1.0)
+    return [float(x) for x in scores]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# PREPARED QUIZ REFERENCES
+# ──────────────────────────────────────────────────────────────────────────────
+
+class PreparedReference:
+    """Reference side of one question, precomputed by POST /prepare."""
+
+    __slots__ = ("question_text", "correct_answer", "text", "ctx_text", "direct_emb", "ctx_emb", "nbytes")
+
+    def __init__(self, question_text: str, correct_answer: str, direct_emb: torch.Tensor, ctx_emb: torch.Tensor):
+        self.question_text = question_text
+        self.correct_answer = correct_answer
+        self.text = PreparedText(correct_answer)
+        self.ctx_text = context_text(question_text, correct_answer)
+        self.direct_emb = direct_emb
+        self.ctx_emb = ctx_emb
+        self.nbytes = (
+            direct_emb.element_size() * direct_emb.nelement()
+            + ctx_emb.element_size() * ctx_emb.nelement()
+            + sys.getsizeof(question_text) + sys.getsizeof(correct_answer)
+            + sys.getsizeof(self.text.normalized) + sys.getsizeof(self.text.letters)
+            + sys.getsizeof(self.ctx_text)
+            + sum(sys.getsizeof(t) for t in self.text.tokens)
+        )
+
+    def pinned(self) -> dict:
+        """Embeddings of the reference strings, keyed as encode_texts() expects."""
+        return {self.correct_answer: self.direct_emb, self.ctx_text: self.ctx_emb}
+
+
+class QuizTooLargeError(Exception):
+    """A quiz's pinned references alone exceed the PreparedQuizStore byte cap."""
+
+
+class PreparedQuizStore:
+    """
+    Pinned reference data per quiz, bounded by a TTL and a total byte cap.
+
+    Unlike the embedding cache, entries are not evicted by per-string LRU
+    churn from student answers: a prepared quiz stays until it expires or,
+    when the byte cap is exceeded, until it is the least recently used quiz.
+
+    The store lives in process memory, so with several gunicorn workers a
+    quiz is only pinned in the worker that served /prepare; grades routed
+    to the others miss and encode the reference as usual.
+    """
+
+    def __init__(self, default_ttl: float, max_bytes: int):
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._quizzes = OrderedDict()  # quizId → (expires_at, {questionId: PreparedReference}, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, quiz_id: str, questions: list[dict], ttl: float | None = None) -> dict:
+        direct_texts = [q["correctAnswer"] for q in questions]
+        ctx_texts = [context_text(q["questionText"], q["correctAnswer"]) for q in questions]
+        embeddings = encode_texts(direct_texts + ctx_texts)
+
+        n = len(questions)
+        refs = {}
+        for i, q in enumerate(questions):
+            refs[q["questionId"]] = PreparedReference(
+                q["questionText"], q["correctAnswer"], embeddings[i].clone(), embeddings[n + i].clone()
+            )
+        nbytes = sum(r.nbytes for r in refs.values())
+        if nbytes > self.max_bytes:
+            raise QuizTooLargeError(f"Quiz needs {nbytes} bytes, above the {self.max_bytes} byte cap")
+
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._drop(quiz_id)
+            self._quizzes[quiz_id] = (expires_at, refs, nbytes)
+            self._bytes += nbytes
+            self._evict()
+        return {"quizId": quiz_id, "prepared": n, "bytes": nbytes, "expiresAt": round(expires_at, 3)}
+
+    def get(self, quiz_id: str, question_id: str) -> PreparedReference | None:
+        with self._lock:
+            entry = self._quizzes.get(quiz_id)
+            if entry is not None and entry[0] <= time.time():
+                self._drop(quiz_id)
+                entry = None
+            ref = entry[1].get(question_id) if entry is not None else None
+            if ref is None:
+                self.misses += 1
+                return None
+            self._quizzes.move_to_end(quiz_id)
+            self.hits += 1
+            return ref
+
+    def _drop(self, quiz_id: str) -> None:
+        entry = self._quizzes.pop(quiz_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self) -> None:
+        now = time.time()
+        for quiz_id in [q for q, entry in self._quizzes.items() if entry[0] <= now]:
+            self._drop(quiz_id)
+        while self._bytes > self.max_bytes and self._quizzes:
+            self._drop(next(iter(self._quizzes)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "quizzes": len(self._quizzes),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+prepared_quizzes = PreparedQuizStore(
+    default_ttl=float(os.environ.get("SBERT_PREPARED_TTL_SECONDS", str(6 * 3600))),
+    max_bytes=int(os.environ.get("SBERT_PREPARED_MAX_BYTES", str(16 * 1024 * 1024))),
+)
+
+
+def resolve_reference(item: dict, quiz_id=None) -> tuple[str, str, PreparedReference | None]:
+    """
+    (questionText, correctAnswer, prepared reference) for a grading request.
+
+    A prepared reference is only used when the request names a prepared
+    quiz/question and does not send a different correctAnswer (e.g. after
+    the teacher edited the quiz).
+    """
+    question_text = item.get('questionText', '')
+    correct_answer = item.get('correctAnswer', '')
+    quiz_id = item.get('quizId', quiz_id)
+    question_id = item.get('questionId')
+    if quiz_id is None or question_id is None:
+        return question_text, correct_answer, None
+
+    ref = prepared_quizzes.get(str(quiz_id), str(question_id))
+    if ref is None:
+        return question_text, correct_answer, None
+    if correct_answer and correct_answer != ref.correct_answer:
+        return question_text, correct_answer, None
+    if question_text and question_text != ref.question_text:
+        return question_text, correct_answer, None
+    return ref.question_text, ref.correct_answer, ref
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SCORE CALIBRATION
+# ──────────────────────────────────────────────────────────────────────────────
+
+class ScoreCalibration:
+    """
+    Monotone map from similarityScore to P(human grader passes the answer).
+
+    Loaded from the `points` ([score, probability] pairs, sorted by score) of a
+    table written by threshold_sweep.py, and interpolated linearly between
+    them. It only adds `calibratedScore`; decisions still use the threshold.
+    """
+
+    def __init__(self, points: list, method: str = "", source: str = ""):
+        if not points or any(b[0] < a[0] for a, b in zip(points, points[1:])):
+            raise ValueError("calibration points must be non-empty and sorted by score")
+        self.xs = [float(x) for x, _ in points]
+        self.ys = [float(y) for _, y in points]
+        self.method = method
+        self.source = source
+
+    @classmethod
+    def load(cls, path: str) -> "ScoreCalibration":
+        with open(path, encoding="utf-8") as f:
+            table = json.load(f)
+        return cls(table["points"], table.get("method", ""), path)
+
+    def __call__(self, score: float) -> float:
+        i = bisect.bisect_right(self.xs, score)
+        if i == 0:
+            return round(self.ys[0], 4)
+        if i == len(self.xs):
+            return round(self.ys[-1], 4)
+        x0, x1, y0, y1 = self.xs[i - 1], self.xs[i], self.ys[i - 1], self.ys[i]
+        return round(y0 + (y1 - y0) * (score - x0) / (x1 - x0), 4)
+
+    def stats(self) -> dict:
+        return {"method": self.method, "points": len(self.xs), "file": self.source}
+
+
+score_calibration = ScoreCalibration.load(CALIBRATION_FILE) if CALIBRATION_FILE else None
+if score_calibration:
+    logger.info(f"Loaded {score_calibration.method} score calibration from {CALIBRATION_FILE}")
+
+
+def with_calibration(result: dict) -> dict:
+    """Add `calibratedScore` to a grading result when a calibration table is loaded."""
+    if score_calibration is None or result.get("layer") == "error":
+        return result
+    return {**result, "calibratedScore": score_calibration(result["similarityScore"])}
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # MASTER GRADING FUNCTION
 # ──────────────────────────────────────────────────────────────────────────────
 
-def compute_grade(question_text: str, student_answer: str, correct_answer: str, threshold: float) -> dict:
+def compute_grade(question_text: str, student_answer: str, correct_answer: str, threshold: float,
+                  reference: PreparedReference | None = None, use_context: bool | None = None,
+                  timings: dict | None = None) -> dict:
     """
     Multi-layer grading pipeline:
 
@@ -198,129 +915,312 @@ def compute_grade(question_text: str, student_answer: str, correct_answer: str,
     Layer 4 — Token overlap gate          → if zero overlap, cap SBERT heavily
     Layer 5 — SBERT semantic similarity   → weighted (NOT max)
     Layer 6 — Final decision
+
+    Every result carries `layer`: empty, gibberish, numeric, exact, substring
+    or sbert.
+
+    `reference` (from POST /prepare) supplies the precomputed reference-side
+    tokens and embeddings, so only the student side is processed.
+    `use_context` overrides CONTEXT_CHANNEL_ENABLED for this call.
+    `timings`, when given, is filled with the grade_timings() breakdown.
+    """
+    t0 = time.perf_counter()
+    pending = grade_cheap_layers(question_text, student_answer, correct_answer, threshold, reference)
+    t1 = time.perf_counter()
+    grading_metrics.observe("preprocess", t1 - t0)
+    if "isCorrect" in pending:
+        grading_metrics.count_decision(pending["layer"])
+        if timings is not None:
+            timings.update(grade_timings(preprocess=t1 - t0, total=t1 - t0))
+        return pending
+
+    # ── Layer 5: SBERT Semantic Similarity ───────────────────────────────────
+    # Use SBERT on answers only (direct), and optionally context-aware.
+    # We do NOT use max() — we use a weighted combination.
+    # All strings (up to four) go through the encoder in a single call.
+
+    pinned = reference.pinned() if reference else None
+    pairs = sbert_pairs(question_text, student_answer, correct_answer, use_context)
+    encode_info = {} if timings is not None else None
+    scores = sbert_pair_similarities(pairs, pinned, encode_info)
+    direct_sbert = scores[0]
+    ctx_sbert = scores[1] if len(scores) > 1 else None
+    t2 = time.perf_counter()
+    grading_metrics.observe("encode", t2 - t1)
+
+    result = finish_grade(pending, direct_sbert, ctx_sbert, threshold)
+    t3 = time.perf_counter()
+    grading_metrics.observe("guards", t3 - t2)
+    grading_metrics.count_decision(result["layer"])
+    if timings is not None:
+        encode = encode_breakdown(pairs[:1], pairs[1:], encode_info, t2 - t1)
+        timings.update(grade_timings(preprocess=t1 - t0, guards=t3 - t2, total=t3 - t0, encode=encode))
+    return result
+
+
+def grade_timings(preprocess: float = 0.0, guards: float = 0.0, total: float = 0.0,
+                  encode: dict | None = None) -> dict:
     """
-    s_norm = normalize(student_answer)
-    c_norm = normalize(correct_answer)
+    Per-request timing breakdown (milliseconds) returned with `debug: true`.
+
+    `queueWaitMs` is the time spent waiting for a micro-batch, `modelLoadMs`
+    a cold get_model() inside the request; both are zero when the request
+    never reached the encoder.
+    """
+    encode = encode or {}
+    return {
+        "queueWaitMs": round(encode.get("queueWaitMs", 0.0), 3),
+        "modelLoadMs": round(encode.get("modelLoadMs", 0.0), 3),
+        "preprocessMs": round(preprocess * 1000, 3),
+        "encodeDirectMs": round(encode.get("encodeDirectMs", 0.0), 3),
+        "encodeContextMs": round(encode.get("encodeContextMs", 0.0), 3),
+        "guardsMs": round(guards * 1000, 3),
+        "totalMs": round(total * 1000, 3),
+        "encodedSentences": encode.get("encodedSentences", 0),
+        "cachedSentences": encode.get("cachedSentences", 0),
+    }
+
+
+def encode_breakdown(direct: list[tuple[str, str]], context: list[tuple[str, str]],
+                     encode_info: dict, seconds: float) -> dict:
+    """
+    Split the wall time of one sbert_pair_similarities() call by channel.
+
+    The direct and context-aware strings go through the same forward pass,
+    so encodeDirectMs/encodeContextMs are an estimate: the time left after
+    queue wait and model load, shared out by each channel's characters among
+    the strings actually encoded (by string count when all were cached).
+    """
+    encoded = encode_info.get("encoded", set())
+    direct_texts = {t for pair in direct for t in pair}
+    context_texts = {t for pair in context for t in pair}
+    direct_chars = sum(len(t) for t in direct_texts & encoded)
+    context_chars = sum(len(t) for t in context_texts & encoded)
+    if direct_chars + context_chars:
+        direct_share = direct_chars / (direct_chars + context_chars)
+    else:
+        direct_share = len(direct_texts) / (len(direct_texts) + len(context_texts))
+
+    queue_wait = encode_info.get("queueWaitMs", 0.0)
+    model_load = encode_info.get("modelLoadMs", 0.0)
+    spent = max(0.0, seconds * 1000 - queue_wait - model_load)
+    return {
+        "queueWaitMs": queue_wait,
+        "modelLoadMs": model_load,
+        "encodeDirectMs": spent * direct_share,
+        "encodeContextMs": spent * (1 - direct_share),
+        "encodedSentences": len(encoded),
+        "cachedSentences": len(direct_texts | context_texts) - len(encoded),
+    }
+
+
+def sbert_pairs(question_text: str, student_answer: str, correct_answer: str,
+                use_context: bool | None = None) -> list[tuple[str, str]]:
+    """The direct pair, followed by the context-aware pair when that channel is on."""
+    if use_context is None:
+        use_context = CONTEXT_CHANNEL_ENABLED
+    pairs = [(student_answer, correct_answer)]
+    if use_context:
+        # Context-aware score (helps for subject-matter questions)
+        pairs.append(context_pair(question_text, student_answer, correct_answer))
+    return pairs
+
+
+def context_text(question_text: str, answer: str) -> str:
+    """The string encoded for the context-aware SBERT channel."""
+    return f"Question: {question_text} Answer: {answer}"
+
+
+def context_pair(question_text: str, student_answer: str, correct_answer: str) -> tuple[str, str]:
+    """The (student, correct) strings used for the context-aware SBERT channel."""
+    return context_text(question_text, student_answer), context_text(question_text, correct_answer)
+
+
+def grade_cheap_layers(question_text: str, student_answer: str, correct_answer: str, threshold: float,
+                       reference: PreparedReference | None = None) -> dict:
+    """
+    Layers 0–4 of the pipeline (everything that does not need the encoder).
+
+    Returns either a final result ({isCorrect, similarityScore, explanation, layer})
+    when a cheap layer decides the grade, or the lexical state that
+    finish_grade() needs once the SBERT scores are known.
+    """
+    student = PreparedText(student_answer)
+    correct = reference.text if reference else PreparedText(correct_answer)
+    s_norm = student.normalized
+    c_norm = correct.normalized
 
     # ── Layer 0: Empty answers ───────────────────────────────────────────────
     if not s_norm:
-        return {"isCorrect": False, "similarityScore": 0.0, "explanation": "No answer provided."}
+        return {"isCorrect": False, "similarityScore": 0.0, "explanation": "No answer provided.",
+                "layer": "empty"}
     if not c_norm:
-        return {"isCorrect": False, "similarityScore": 0.0, "explanation": "No reference answer available."}
+        return {"isCorrect": False, "similarityScore": 0.0, "explanation": "No reference answer available.",
+                "layer": "empty"}
 
-    logger.info(f"  Student  : {s_norm}")
-    logger.info(f"  Correct  : {c_norm}")
-    logger.info(f"  Threshold: {threshold}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"  Student  : {s_norm}")
+        logger.debug(f"  Correct  : {c_norm}")
+        logger.debug(f"  Threshold: {threshold}")
 
     # ── Layer 1: Gibberish detection ─────────────────────────────────────────
-    if is_gibberish(s_norm):
-        logger.info("  ❌ Gibberish detected → score 0.0")
+    if is_gibberish(student):
+        logger.debug("  ❌ Gibberish detected → score 0.0")
         return {
             "isCorrect": False,
             "similarityScore": 0.0,
-            "explanation": "Answer appears to be random/gibberish text with no recognizable words."
+            "explanation": "Answer appears to be random/gibberish text with no recognizable words.",
+            "layer": "gibberish"
         }
 
     # ── Layer 2: Numeric answer ──────────────────────────────────────────────
-    if is_numeric_answer(c_norm):
-        result = grade_numeric(s_norm, c_norm)
+    if is_numeric_answer(correct):
+        result = grade_numeric(student, correct)
         final_score = result["score"]
         is_correct = final_score >= threshold
-        logger.info(f"  Numeric grade → score={final_score:.4f}")
+        logger.debug("  Numeric grade → score=%.4f", final_score)
         return {
             "isCorrect": is_correct,
             "similarityScore": round(final_score, 4),
-            "explanation": result["explanation"]
+            "explanation": result["explanation"],
+            "layer": "numeric"
         }
 
     # ── Layer 3: Exact / Near-exact match ────────────────────────────────────
     if s_norm == c_norm:
-        logger.info("  ✅ Exact match")
-        return {"isCorrect": True, "similarityScore": 1.0, "explanation": "Exact match."}
+        logger.debug("  ✅ Exact match")
+        return {"isCorrect": True, "similarityScore": 1.0, "explanation": "Exact match.", "layer": "exact"}
 
     # Substring containment (only when correct is meaningful & student has it)
     if len(c_norm) > 3 and c_norm in s_norm:
-        logger.info("  ✅ Correct answer contained in student answer")
+        logger.debug("  ✅ Correct answer contained in student answer")
         return {
             "isCorrect": True,
             "similarityScore": 1.0,
-            "explanation": "Answer contains the complete correct answer."
+            "explanation": "Answer contains the complete correct answer.",
+            "layer": "substring"
         }
 
     # ── Layer 4: Token overlap gate ──────────────────────────────────────────
-    jaccard = jaccard_similarity(s_norm, c_norm)
-    f1 = token_f1(s_norm, c_norm)
+    jaccard = jaccard_similarity(student, correct)
+    f1 = token_f1(student, correct)
     lexical_score = (jaccard + f1) / 2.0
-    logger.info(f"  Jaccard={jaccard:.4f}  F1={f1:.4f}  Lexical={lexical_score:.4f}")
-
-    # Detect short correct answers (≤ 3 words) — SBERT is unreliable for very short texts
-    correct_words = tokenize(c_norm)
-    student_words = tokenize(s_norm)
-    is_short_correct = len(correct_words) <= 3
+    logger.debug("  Jaccard=%.4f  F1=%.4f  Lexical=%.4f", jaccard, f1, lexical_score)
 
-    # ── Layer 5: SBERT Semantic Similarity ───────────────────────────────────
-    # Use SBERT on answers only (direct), and optionally context-aware.
-    # We do NOT use max() — we use a weighted combination.
+    return {"lexical_score": lexical_score, "student": student, "correct": correct}
 
-    direct_sbert = sbert_similarity(student_answer, correct_answer)
 
-    # Context-aware score (helps for subject-matter questions)
-    ctx_student = f"Question: {question_text} Answer: {student_answer}"
-    ctx_correct = f"Question: {question_text} Answer: {correct_answer}"
-    ctx_sbert = sbert_similarity(ctx_student, ctx_correct)
+def finish_grade(pending: dict, direct_sbert: float, ctx_sbert: float | None, threshold: float) -> dict:
+    """
+    Layer 6: blend the SBERT scores with the lexical state and apply guards A–E.
 
+    `ctx_sbert` is None when the context-aware channel is disabled; the direct
+    score then carries the full SBERT weight.
+    """
     # Weighted average: 60% direct, 40% context-aware
-    raw_sbert = 0.6 * direct_sbert + 0.4 * ctx_sbert
-    logger.info(f"  SBERT direct={direct_sbert:.4f}  ctx={ctx_sbert:.4f}  weighted={raw_sbert:.4f}")
+    if ctx_sbert is None:
+        raw_sbert = direct_sbert
+        logger.debug("  SBERT direct=%.4f  (context channel off)", direct_sbert)
+    else:
+        raw_sbert = 0.6 * direct_sbert + 0.4 * ctx_sbert
+        logger.debug("  SBERT direct=%.4f  ctx=%.4f  weighted=%.4f", direct_sbert, ctx_sbert, raw_sbert)
+
+    guards = []
+    final_score = guarded_score(pending, raw_sbert, guards)
+    grading_metrics.count_guards(guards)
+    is_correct = final_score >= threshold
+    explanation = generate_explanation(final_score, threshold)
+
+    logger.debug("  Final score=%s  Correct=%s", final_score, is_correct)
+    return {
+        "isCorrect": is_correct,
+        "similarityScore": final_score,
+        "explanation": explanation,
+        "layer": "sbert"
+    }
+
+
+def guarded_score(pending: dict, raw_sbert: float, fired: list | None = None) -> float:
+    """
+    Layer 6 proper: combine a raw SBERT score with the lexical state under guards A–E.
+
+    The guards that applied ("A"–"E", or "normal" for the plain blend) are
+    appended to `fired` when given.
+    """
+    final_score = _blend_guards(pending, raw_sbert, fired)
+
+    # Guard E: Length mismatch penalty (1-word vs long answer)
+    if _length_guard_applies(pending) and final_score > 0.5:
+        final_score = max(0.0, final_score - 0.30)
+        if fired is not None:
+            fired.append("E")
+
+    if fired is not None and logger.isEnabledFor(logging.DEBUG):
+        for guard in fired:
+            logger.debug(f"  {GUARD_DESCRIPTIONS[guard]}")
+        logger.debug(f"  Guarded score → {final_score:.4f}")
+    return _clamp_score(final_score)
+
+
+GUARD_DESCRIPTIONS = {
+    "A": "⚠️ Zero lexical overlap on short answer → capped at 0.25",
+    "B": "⚠️ Zero lexical overlap → 40% discount",
+    "C": "⚠️ Low lexical overlap → blended+discounted",
+    "normal": "✅ Normal blend",
+    "D": "⚠️ Negation mismatch penalty",
+    "E": "⚠️ Length mismatch penalty",
+}
+
+
+def _blend_guards(pending: dict, raw_sbert: float, fired: list | None = None) -> float:
+    """Guards A–D (everything before the length guard)."""
+    lexical_score = pending["lexical_score"]
+    student = pending["student"]
+    correct = pending["correct"]
+    # Detect short correct answers (≤ 3 words) — SBERT is unreliable for very short texts
+    is_short_correct = len(correct.tokens) <= 3
 
     # ── Layer 6: Combine scores and apply guards ──────────────────────────────
 
     # Guard A: Zero token overlap with short/numeric-looking correct answers → hard cap
     if lexical_score == 0.0 and is_short_correct:
         final_score = min(raw_sbert, 0.25)
-        logger.info(f"  ⚠️ Zero lexical overlap on short answer → capped at 0.25 → {final_score:.4f}")
+        guard = "A"
 
     # Guard B: Zero token overlap on longer answers → significant discount
     elif lexical_score == 0.0:
         final_score = raw_sbert * 0.4
-        logger.info(f"  ⚠️ Zero lexical overlap → 40% discount → {final_score:.4f}")
+        guard = "B"
 
     # Guard C: Very low lexical overlap (< 10%) → partial discount
     elif lexical_score < 0.10:
         blend = 0.3 * lexical_score + 0.7 * raw_sbert
         final_score = blend * 0.75
-        logger.info(f"  ⚠️ Low lexical overlap → blended+discounted → {final_score:.4f}")
+        guard = "C"
 
     # Normal: meaningful lexical overlap — trust SBERT more, blend with lexical
     else:
         # 70% SBERT, 30% lexical for well-overlapping answers
         final_score = 0.70 * raw_sbert + 0.30 * lexical_score
-        logger.info(f"  ✅ Normal blend → {final_score:.4f}")
+        guard = "normal"
+    if fired is not None:
+        fired.append(guard)
 
     # Guard D: Negation mismatch — one has "not/never/no" and other doesn't
-    neg_words = {"not", "never", "no", "none", "nothing", "isn't", "aren't",
-                 "don't", "doesn't", "won't", "can't", "couldn't", "wouldn't", "shouldn't"}
-    s_has_neg = bool(set(student_words) & neg_words)
-    c_has_neg = bool(set(correct_words) & neg_words)
-    if s_has_neg != c_has_neg:
+    if student.has_negation != correct.has_negation:
         final_score = max(0.0, final_score - 0.30)
-        logger.info(f"  ⚠️ Negation mismatch penalty → {final_score:.4f}")
+        if fired is not None:
+            fired.append("D")
 
-    # Guard E: Length mismatch penalty (1-word vs long answer)
-    if len(student_words) <= 2 and len(correct_words) >= 5 and final_score > 0.5:
-        final_score = max(0.0, final_score - 0.30)
-        logger.info(f"  ⚠️ Length mismatch penalty → {final_score:.4f}")
+    return final_score
 
-    final_score = round(max(0.0, min(1.0, final_score)), 4)
-    is_correct = final_score >= threshold
-    explanation = generate_explanation(final_score, threshold)
 
-    logger.info(f"  Final score={final_score}  Correct={is_correct}")
-    return {
-        "isCorrect": is_correct,
-        "similarityScore": final_score,
-        "explanation": explanation
-    }
+def _length_guard_applies(pending: dict) -> bool:
+    return len(pending["student"].tokens) <= 2 and len(pending["correct"].tokens) >= 5
+
+
+def _clamp_score(score: float) -> float:
+    return round(max(0.0, min(1.0, score)), 4)
 
 
 def generate_explanation(score: float, threshold: float) -> str:
@@ -338,35 +1238,279 @@ def generate_explanation(score: float, threshold: float) -> str:
         return "Incorrect — answer does not match the correct answer."
 
 
+def grade_batch(answers: list[dict], threshold: float, quiz_id=None,
+                use_context: bool | None = None, timings: dict | None = None) -> list[dict]:
+    """
+    Grade a whole submission with a single SBERT forward pass.
+
+    Layers 0–4 run per item first; only the items they leave undecided have
+    their direct and context-aware strings encoded, together, in one batch.
+    Layer 6 then runs per item on the vectorized cosine scores, so every
+    result matches what compute_grade() returns for the same input.
+    Items that name a prepared question reuse its pinned reference data.
+    `timings` is as for iter_grade_batch().
+    """
+    results = [None] * len(answers)
+    for result in iter_grade_batch(answers, threshold, quiz_id, use_context, timings=timings):
+        results[result['index']] = result
+    return results
+
+
+def iter_grade_batch(answers: list[dict], threshold: float, quiz_id=None,
+                     use_context: bool | None = None, chunk_size: int | None = None,
+                     timings: dict | None = None):
+    """
+    Yield batch results as soon as each one is decided, cheap layers first.
+
+    Items decided by layers 0–4 are yielded immediately. The rest are encoded
+    `chunk_size` items per forward pass (all at once when None) and yielded
+    after each pass, so a streaming caller never holds more than one chunk
+    of embeddings or results.
+
+    When `timings` is given, every result carries its own grade_timings()
+    breakdown and `timings` is filled with the totals for the whole batch.
+    An SBERT item reports the forward pass of its chunk, shared by the
+    `chunkItems` items encoded with it.
+    """
+    grading_metrics.observe("batch_answers", len(answers))
+    t0 = time.perf_counter()
+    if timings is not None:
+        timings.update(grade_timings())
+    for result in _iter_batch_results(answers, threshold, quiz_id, use_context, chunk_size, timings):
+        grading_metrics.count_decision(result["layer"])
+        yield result
+    if timings is not None:
+        timings.update({key: round(value, 3) for key, value in timings.items()},
+                       totalMs=round((time.perf_counter() - t0) * 1000, 3))
+
+
+def _add_timings(totals: dict, part: dict) -> None:
+    for key in ("queueWaitMs", "modelLoadMs", "preprocessMs", "encodeDirectMs", "encodeContextMs",
+                "guardsMs", "encodedSentences", "cachedSentences"):
+        totals[key] += part.get(key, 0)
+
+
+def _iter_batch_results(answers: list[dict], threshold: float, quiz_id, use_context, chunk_size,
+                        timings: dict | None = None):
+    pending = []  # (idx, lexical state, pairs, pinned, preprocess seconds)
+
+    for idx, item in enumerate(answers):
+        try:
+            question_text, correct_answer, reference = resolve_reference(item, quiz_id)
+            student_answer = item.get('studentAnswer', '')
+            t0 = time.perf_counter()
+            state = grade_cheap_layers(question_text, student_answer, correct_answer, threshold, reference)
+            preprocess = time.perf_counter() - t0
+            grading_metrics.observe("preprocess", preprocess)
+            if timings is not None:
+                timings["preprocessMs"] += preprocess * 1000
+            if "isCorrect" in state:
+                if timings is not None:
+                    state = {**state, "timings": grade_timings(preprocess=preprocess, total=preprocess)}
+                yield {'index': idx, **state}
+            else:
+                item_pairs = sbert_pairs(question_text, student_answer, correct_answer, use_context)
+                pending.append((idx, state, item_pairs, reference.pinned() if reference else None, preprocess))
+        except Exception as e:
+            logger.error(f"Error grading item {idx}: {e}")
+            yield grading_error(idx, e)
+
+    if not pending:
+        return
+    logger.debug("  Batch SBERT: %d/%d items need encoding", len(pending), len(answers))
+
+    step = chunk_size or len(pending)
+    for chunk_start in range(0, len(pending), step):
+        chunk = pending[chunk_start:chunk_start + step]
+        yield from _finish_chunk(chunk, threshold, timings)
+
+
+def _finish_chunk(chunk: list[tuple], threshold: float, timings: dict | None = None):
+    """Encode one chunk of undecided batch items together and apply layer 6."""
+    pairs = []
+    pinned = {}
+    offsets = []
+    for _, _, item_pairs, item_pinned, _ in chunk:
+        offsets.append((len(pairs), len(item_pairs)))
+        pairs.extend(item_pairs)
+        if item_pinned:
+            pinned.update(item_pinned)
+
+    encode_info = {} if timings is not None else None
+    try:
+        t0 = time.perf_counter()
+        scores = sbert_pair_similarities(pairs, pinned, encode_info)
+        encode_seconds = time.perf_counter() - t0
+        grading_metrics.observe("encode", encode_seconds)
+    except Exception as e:
+        logger.error(f"Error encoding batch: {e}", exc_info=True)
+        for idx, *_ in chunk:
+            yield grading_error(idx, e)
+        return
+
+    if timings is not None:
+        encode = encode_breakdown([item_pairs[0] for _, _, item_pairs, _, _ in chunk],
+                                  [pair for _, _, item_pairs, _, _ in chunk for pair in item_pairs[1:]],
+                                  encode_info, encode_seconds)
+        _add_timings(timings, encode)
+
+    for (idx, state, _, _, preprocess), (start, count) in zip(chunk, offsets):
+        try:
+            ctx_sbert = scores[start + 1] if count > 1 else None
+            t0 = time.perf_counter()
+            result = finish_grade(state, scores[start], ctx_sbert, threshold)
+            guards = time.perf_counter() - t0
+            grading_metrics.observe("guards", guards)
+            if timings is not None:
+                timings["guardsMs"] += guards * 1000
+                result["timings"] = grade_timings(preprocess=preprocess, guards=guards,
+                                                  total=preprocess + encode_seconds + guards, encode=encode)
+                result["timings"]["chunkItems"] = len(chunk)
+            yield {'index': idx, **result}
+        except Exception as e:
+            logger.error(f"Error grading item {idx}: {e}")
+            yield grading_error(idx, e)
+
+
+def grading_error(idx: int, error: Exception) -> dict:
+    return {
+        'index': idx,
+        'isCorrect': False,
+        'similarityScore': 0.0,
+        'explanation': f'Grading error: {str(error)}',
+        'layer': 'error'
+    }
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # FLASK ROUTES
 # ──────────────────────────────────────────────────────────────────────────────
 
+def process_memory() -> dict:
+    """RSS of this worker process in MB: current (from /proc, Linux only) and peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        rss_mb = None
+    # ru_maxrss is KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'pid': os.getpid(), 'rssMb': round(rss_mb, 1) if rss_mb is not None else None, 'peakRssMb': round(peak_mb, 1)}
+
+
+TRUE_STRINGS = ('1', 'true', 'yes', 'on')
+FALSE_STRINGS = ('0', 'false', 'no', 'off')
+
+
+def parse_flag(value, name: str) -> bool | None:
+    """
+    A JSON boolean, or one of TRUE_STRINGS / FALSE_STRINGS; None when absent.
+
+    Raises ValueError on anything else, so that e.g. "false" never reads as truthy.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in TRUE_STRINGS:
+            return True
+        if text in FALSE_STRINGS:
+            return False
+    raise ValueError(f"'{name}' must be a boolean, got {value!r}")
+
+
+def timing_requested(data: dict) -> bool:
+    """
+    Per-request timings are opt-in: `debug: true` in the body or an X-Grade-Timing header.
+
+    Raises ValueError when `debug` is not a boolean (see parse_flag).
+    """
+    header = request.headers.get('X-Grade-Timing', '').strip().lower()
+    return bool(parse_flag(data.get('debug'), 'debug')) or header in TRUE_STRINGS
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    if request.endpoint in (None, 'metrics'):
+        return response
+    path, status, start = request.path, response.status_code, g.request_start
+
+    def observe():
+        grading_metrics.observe_request(path, status, time.perf_counter() - start)
+
+    # A streamed body (NDJSON /batch-grade) is generated after this hook
+    # returns; time it up to the point the server closes the response.
+    if response.is_streamed:
+        response.call_on_close(observe)
+    else:
+        observe()
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint (text exposition format 0.0.4) for this worker."""
+    return Response(grading_metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'model': 'all-MiniLM-L6-v2', 'service': 'sbert-grading'})
+    """Reports ready only once the model is loaded and warm (503 while an eager load is pending)."""
+    ready = _model is not None
+    status_code = 503 if EAGER_LOAD and not ready else 200
+    return jsonify({
+        'status': 'healthy' if ready or not EAGER_LOAD else 'loading',
+        'ready': ready,
+        'modelLoadSeconds': MODEL_LOAD_SECONDS,
+        'model': MODEL_NAME,
+        'backend': SBERT_BACKEND,
+        'service': 'sbert-grading',
+        'contextChannel': CONTEXT_CHANNEL_ENABLED,
+        'embeddingCache': embedding_cache.stats(),
+        'preparedQuizzes': prepared_quizzes.stats(),
+        'microBatching': inference_scheduler.stats(),
+        'memory': process_memory(),
+        'calibration': score_calibration.stats() if score_calibration else None,
+    }), status_code
 
 
 @app.route('/grade', methods=['POST'])
 def grade_answer():
     """
     POST /grade
-    Body: { questionText, studentAnswer, correctAnswer, threshold? }
-    Returns: { isCorrect, similarityScore, explanation }
+    Body: { questionText, studentAnswer, correctAnswer, threshold?, quizId?, questionId?, contextAware?, debug? }
+    Returns: { isCorrect, similarityScore, explanation, layer, calibratedScore?, timings? }
+
+    With quizId/questionId of a quiz sent to /prepare, questionText and
+    correctAnswer may be omitted. `debug: true` (or an X-Grade-Timing: 1
+    header) adds the grade_timings() breakdown as `timings`.
     """
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
 
-        question_text  = data.get('questionText', '')
+        question_text, correct_answer, reference = resolve_reference(data)
         student_answer = data.get('studentAnswer', '')
-        correct_answer = data.get('correctAnswer', '')
         threshold      = float(data.get('threshold', 0.75))
-
-        logger.info("── Grade request ──────────────────────────")
-
-        result = compute_grade(question_text, student_answer, correct_answer, threshold)
+        try:
+            use_context = parse_flag(data.get('contextAware'), 'contextAware')
+            timings = {} if timing_requested(data) else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        logger.debug("── Grade request ──────────────────────────")
+
+        result = compute_grade(question_text, student_answer, correct_answer, threshold, reference,
+                               use_context, timings)
+        result = with_calibration(result)
+        if timings is not None:
+            result = {**result, 'timings': timings}
         return jsonify(result)
 
     except Exception as e:
@@ -378,8 +1522,18 @@ def grade_answer():
 def batch_grade():
     """
     POST /batch-grade
-    Body: { threshold?, answers: [{ questionText, studentAnswer, correctAnswer }] }
-    Returns: { results: [...] }
+    Body: { threshold?, quizId?, contextAware?, debug?, answers: [{ questionText, studentAnswer, correctAnswer, questionId? }] }
+    Returns: { results: [...], timings? }
+
+    When the Accept header prefers application/x-ndjson over application/json
+    (ties go to JSON), the results are streamed instead, one
+    `{ index, isCorrect, similarityScore, explanation, layer }` JSON object per line,
+    in the order they are decided (cheap layers first, then SBERT chunks).
+
+    `debug: true` (or an X-Grade-Timing: 1 header) adds `timings` to every
+    result plus the batch totals: a top-level `timings` key, or a final
+    `{ timings }` line when streaming. With SBERT_CALIBRATION_FILE set, every
+    result also carries `calibratedScore`.
     """
     try:
         data = request.get_json()
@@ -388,26 +1542,29 @@ def batch_grade():
 
         answers   = data['answers']
         threshold = float(data.get('threshold', 0.75))
-        results   = []
-
-        for idx, item in enumerate(answers):
-            try:
-                result = compute_grade(
-                    item.get('questionText', ''),
-                    item.get('studentAnswer', ''),
-                    item.get('correctAnswer', ''),
-                    threshold
-                )
-                results.append({'index': idx, **result})
-            except Exception as e:
-                logger.error(f"Error grading item {idx}: {e}")
-                results.append({
-                    'index': idx,
-                    'isCorrect': False,
-                    'similarityScore': 0.0,
-                    'explanation': f'Grading error: {str(e)}'
-                })
+        try:
+            use_context = parse_flag(data.get('contextAware'), 'contextAware')
+            timings = {} if timing_requested(data) else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+            results = iter_grade_batch(answers, threshold, data.get('quizId'), use_context,
+                                       chunk_size=STREAM_CHUNK_SIZE, timings=timings)
+
+            def lines():
+                for result in results:
+                    yield json.dumps(with_calibration(result)) + '\n'
+                if timings is not None:
+                    yield json.dumps({'timings': timings}) + '\n'
 
+            return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+        results   = grade_batch(answers, threshold, data.get('quizId'), use_context, timings)
+        results   = [with_calibration(result) for result in results]
+
+        if timings is not None:
+            return jsonify({'results': results, 'timings': timings})
         return jsonify({'results': results})
 
     except Exception as e:
@@ -415,5 +1572,61 @@ def batch_grade():
         return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
 
+@app.route('/prepare', methods=['POST'])
+def prepare_quiz():
+    """
+    POST /prepare
+    Body: { quizId, ttlSeconds?, questions: [{ questionId, questionText, correctAnswer }] }
+    Returns: { quizId, prepared, bytes, expiresAt }
+
+    Precomputes and pins the reference side of every question so later
+    /grade and /batch-grade calls carrying quizId/questionId only encode
+    the student answers. `ttlSeconds` must be a positive number. The pins
+    are per worker process (see PreparedQuizStore): run one worker with
+    threads for every grade to hit them.
+    """
+    try:
+        data = request.get_json()
+        if not data or data.get('quizId') is None or not data.get('questions'):
+            return jsonify({'error': 'quizId and questions are required'}), 400
+
+        questions = []
+        for q in data['questions']:
+            if q.get('questionId') is None:
+                return jsonify({'error': 'Every question needs a questionId'}), 400
+            questions.append({
+                'questionId':    str(q['questionId']),
+                'questionText':  q.get('questionText', ''),
+                'correctAnswer': q.get('correctAnswer', ''),
+            })
+
+        ttl = data.get('ttlSeconds')
+        if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, (int, float))
+                                or not 0 < ttl < float('inf')):
+            return jsonify({'error': f"'ttlSeconds' must be a positive number, got {ttl!r}"}), 400
+
+        result = prepared_quizzes.prepare(str(data['quizId']), questions,
+                                          float(ttl) if ttl is not None else None)
+        logger.info(f"Prepared quiz {result['quizId']}: {result['prepared']} questions, {result['bytes']} bytes")
+        return jsonify(result)
+
+    except QuizTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        logger.error(f"Error in /prepare: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# STARTUP
+# ──────────────────────────────────────────────────────────────────────────────
+
+if EAGER_LOAD:
+    get_model()
+    # Move everything allocated so far out of the GC's generations, so garbage
+    # collections in forked workers don't write to (and un-share) these pages.
+    gc.freeze()
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002, debug=False)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the grading pre-processing (no SBERT involved).
+
+Compares the keyword-only grading path (grading_eval.py mode 2) computed
+from raw strings — where normalize()/tokenize() re-run inside every layer
+function — against the same path on PreparedText objects built once per
+input. Also times layers 0–4 of the production pipeline.
+
+Run from sbert-service/:
+  python bench_preprocessing.py
+"""
+
+import statistics
+import timeit
+
+from app import (
+    PreparedText,
+    grade_cheap_layers,
+    jaccard_similarity,
+    normalize,
+    token_f1,
+)
+from grading_eval import TEST_CASES, THRESHOLD
+
+REPEAT = 7
+NUMBER = 200
+
+
+def keyword_from_strings():
+    for tc in TEST_CASES:
+        s = normalize(tc["student"])
+        c = normalize(tc["correct"])
+        if s != c:
+            (jaccard_similarity(s, c) + token_f1(s, c)) / 2.0
+
+
+def keyword_from_prepared():
+    for tc in TEST_CASES:
+        s = PreparedText(tc["student"])
+        c = PreparedText(tc["correct"])
+        if s.normalized != c.normalized:
+            (jaccard_similarity(s, c) + token_f1(s, c)) / 2.0
+
+
+def cheap_layers():
+    for tc in TEST_CASES:
+        grade_cheap_layers(tc["q"], tc["student"], tc["correct"], THRESHOLD)
+
+
+def bench(fn):
+    """Per-answer time in microseconds: (best, median) over REPEAT runs."""
+    runs = timeit.repeat(fn, repeat=REPEAT, number=NUMBER)
+    per_answer = [r / (NUMBER * len(TEST_CASES)) * 1e6 for r in runs]
+    return min(per_answer), statistics.median(per_answer)
+
+
+def main():
+    import logging
+    logging.getLogger("app").setLevel(logging.WARNING)  # keep layer logging out of the timings
+
+    print(f"{len(TEST_CASES)} answers x {NUMBER} loops x {REPEAT} repeats\n")
+    print(f"  {'Path':<28}  {'best us':>8}  {'median us':>9}")
+    print(f"  {'-'*28}  {'-'*8}  {'-'*9}")
+    results = {}
+    for name, fn in [("keyword, raw strings", keyword_from_strings),
+                     ("keyword, PreparedText", keyword_from_prepared),
+                     ("layers 0-4 (pipeline)", cheap_layers)]:
+        results[name] = bench(fn)
+        best, median = results[name]
+        print(f"  {name:<28}  {best:>8.2f}  {median:>9.2f}")
+
+    speedup = results["keyword, raw strings"][1] / results["keyword, PreparedText"][1]
+    print(f"\nPreparedText speedup on the keyword path: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
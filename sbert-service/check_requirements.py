@@ -138,6 +138,18 @@ def check_dependencies():
     
     return all_installed
 
+def check_onnx_backend():
+    """Check if ONNX Runtime is available for SBERT_BACKEND=onnx / onnx-int8 (optional)"""
+    try:
+        import onnxruntime
+        import optimum.onnxruntime  # noqa: F401
+        print_check("ONNX Runtime (Optional)", True, f"onnxruntime {onnxruntime.__version__}")
+        return True
+    except ImportError:
+        print_check("ONNX Runtime (Optional)", False,
+                   "Not installed (only needed for SBERT_BACKEND=onnx / onnx-int8)")
+        return False
+
 def check_docker():
     """Check if Docker is available (optional)"""
     try:
@@ -201,6 +213,7 @@ def main():
     results["Dependencies"] = check_dependencies()
     
     print_header("Optional Components")
+    results["ONNX Runtime"] = check_onnx_backend()
     results["Docker"] = check_docker()
     results["Docker Compose"] = check_docker_compose()
     
@@ -11,6 +11,10 @@ Grading modes:
   2. Keyword-Only  — Jaccard + token F1 (lexical channel)
   3. Full Pipeline  — 6-layer grading with SBERT (production system)
 
+The full pipeline is also run with the context-aware SBERT channel turned
+off (SBERT_CONTEXT_CHANNEL=0 / contextAware=false) to record the accuracy
+vs latency tradeoff of that switch.
+
 Metrics: Accuracy, Precision, Recall, F1, Cohen's Kappa, MAE, Avg Latency
 
 Output:
@@ -19,12 +23,37 @@ Output:
 
 Run from sbert-service/:
   python grading_eval.py
+  python grading_eval.py --compare-backends torch onnx-int8
+
+--compare-backends runs the full pipeline once per SBERT_BACKEND, each in its
+own process (so peak RSS is per backend), and writes accuracy, kappa,
+p50/p95 latency, peak RSS and the cosine agreement of every backend's
+embeddings with the first one to backend_comparison_report.json.
+
+--bench times the modes instead (plus the full pipeline graded as one batch
+through grade_batch()), each in its own worker process, `--parallel` at a
+time. Every mode gets `--warmup` untimed passes over the test set and
+`--repeats` timed ones, and grading_bench_report.json records mean/stdev/
+p50/p95/p99 with 95% confidence intervals. `--baseline` compares the pass
+times with an earlier report and flags changes whose interval excludes 0:
+  python grading_eval.py --bench --repeats 20
+  python grading_eval.py --bench full_pipeline --baseline old_bench.json
 """
 
+import argparse
 import json
+import math
+import multiprocessing
+import random
+import resource
+import statistics
+import subprocess
 import sys
+import tempfile
 import time
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # ── Import the actual grading pipeline from app.py ────────────────────────────
@@ -32,7 +61,13 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 from app import (
     compute_grade,
+    context_text,
+    embedding_cache,
+    grade_batch,
+    BACKEND_COSINE_TOLERANCE,
+    SBERT_BACKEND,
     normalize,
+    PreparedText,
     jaccard_similarity,
     token_f1,
     get_model,  # Forces SBERT model load
@@ -41,6 +76,8 @@ from app import (
 OUT_DIR  = Path(__file__).resolve().parent
 OUT_JSON = OUT_DIR / "grading_eval_report.json"
 OUT_TXT  = OUT_DIR / "grading_eval_summary.txt"
+OUT_BACKENDS = OUT_DIR / "backend_comparison_report.json"
+OUT_BENCH = OUT_DIR / "grading_bench_report.json"
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 100 CURATED TEST CASES — human-labeled ground truth
@@ -184,9 +221,9 @@ def exact_match_grade(question, student, correct):
 
 def keyword_only_grade(question, student, correct):
     """Mode 2: Jaccard + token F1 only (no SBERT)."""
-    s = normalize(student)
-    c = normalize(correct)
-    if s == c:
+    s = PreparedText(student)
+    c = PreparedText(correct)
+    if s.normalized == c.normalized:
         return {"similarityScore": 1.0, "isCorrect": True}
     jacc = jaccard_similarity(s, c)
     f1   = token_f1(s, c)
@@ -196,7 +233,23 @@ def keyword_only_grade(question, student, correct):
 
 def full_pipeline_grade(question, student, correct):
     """Mode 3: Full 6-layer pipeline from app.py (with SBERT)."""
-    return compute_grade(question, student, correct, THRESHOLD)
+    timings = {}
+    result = compute_grade(question, student, correct, THRESHOLD, timings=timings)
+    return {**result, "timings": timings}
+
+
+def direct_only_grade(question, student, correct):
+    """Mode 3 with the context-aware SBERT channel disabled."""
+    timings = {}
+    result = compute_grade(question, student, correct, THRESHOLD, use_context=False, timings=timings)
+    return {**result, "timings": timings}
+
+
+def batched_pipeline_grade(cases):
+    """Mode 3 for a whole submission: every case in one grade_batch() call (one forward pass)."""
+    answers = [{"questionText": tc["q"], "studentAnswer": tc["student"], "correctAnswer": tc["correct"]}
+               for tc in cases]
+    return grade_batch(answers, THRESHOLD)
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -270,9 +323,9 @@ def run_mode(mode_name, grade_fn):
     latencies = []
 
     for tc in TEST_CASES:
-        t0 = time.time()
+        t0 = time.perf_counter_ns()
         out = grade_fn(tc["q"], tc["student"], tc["correct"])
-        elapsed_ms = (time.time() - t0) * 1000
+        elapsed_ms = (time.perf_counter_ns() - t0) / 1e6
         latencies.append(elapsed_ms)
 
         results.append({
@@ -285,24 +338,385 @@ def run_mode(mode_name, grade_fn):
             "expectedPass":    tc["expectedPass"],
             "latency_ms":      round(elapsed_ms, 2),
         })
+        if "layer" in out:
+            results[-1]["layer"] = out["layer"]
+        if "timings" in out:
+            results[-1]["timings"] = out["timings"]
 
     metrics = compute_metrics(results)
     cat_breakdown = compute_category_breakdown(results)
 
     avg_lat = sum(latencies) / len(latencies) if latencies else 0
+    p50_lat = sorted(latencies)[int(len(latencies) * 0.50)] if latencies else 0
     p95_lat = sorted(latencies)[int(len(latencies) * 0.95)] if latencies else 0
 
-    return {
+    summary = {
         "mode": mode_name,
         "metrics": metrics,
         "category_breakdown": cat_breakdown,
         "avg_latency_ms": round(avg_lat, 2),
+        "p50_latency_ms": round(p50_lat, 2),
         "p95_latency_ms": round(p95_lat, 2),
-        "per_case": results,
     }
+    # Pipeline modes report which layer decided each case
+    layers = [r["layer"] for r in results if "layer" in r]
+    if layers:
+        summary["layer_counts"] = dict(Counter(layers))
+        summary["sbert_skip_rate"] = round(sum(l != "sbert" for l in layers) / len(layers), 4)
+    # ...and where the time went (mean of the per-case breakdown, in ms)
+    timed = [r["timings"] for r in results if "timings" in r]
+    if timed:
+        summary["avg_timings_ms"] = {
+            stage: round(sum(t[stage] for t in timed) / len(timed), 3)
+            for stage in timed[0] if stage.endswith("Ms")
+        }
+    summary["per_case"] = results
+    return summary
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# BACKEND COMPARISON (torch vs ONNX Runtime / int8)
+# ──────────────────────────────────────────────────────────────────────────────
+
+def probe_texts():
+    """Every distinct string the pipeline can encode for the test set."""
+    texts = []
+    for tc in TEST_CASES:
+        texts += [tc["student"], tc["correct"],
+                  context_text(tc["q"], tc["student"]), context_text(tc["q"], tc["correct"])]
+    return list(dict.fromkeys(texts))
+
+
+def backend_worker(out_path):
+    """Runs inside a child process with SBERT_BACKEND set; writes one result file."""
+    import numpy as np
+
+    t0 = time.perf_counter()
+    model = get_model()
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    embedding_cache.clear()
+    result = run_mode("full_pipeline", full_pipeline_grade)
+    embeddings = model.encode(probe_texts(), convert_to_numpy=True, normalize_embeddings=True)
+    np.save(f"{out_path}.npy", embeddings)
+
+    summary = {
+        "backend": SBERT_BACKEND,
+        "model_load_ms": round(load_ms, 1),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "metrics": result["metrics"],
+        "avg_latency_ms": result["avg_latency_ms"],
+        "p50_latency_ms": result["p50_latency_ms"],
+        "p95_latency_ms": result["p95_latency_ms"],
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f)
+
+
+def compare_backends(backends):
+    import numpy as np
+
+    print("=" * 65)
+    print("  Speechify -- SBERT Backend Comparison")
+    print(f"  Backends: {', '.join(backends)}  |  Threshold: {THRESHOLD}")
+    print("=" * 65)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            print(f"\nRunning full pipeline on backend '{backend}' ...")
+            out_path = os.path.join(tmp, f"{backend}.json")
+            subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--backend-worker", out_path],
+                env={**os.environ, "SBERT_BACKEND": backend},
+                check=True,
+            )
+            with open(out_path, encoding="utf-8") as f:
+                run = json.load(f)
+            run["embeddings"] = np.load(f"{out_path}.npy")
+            runs.append(run)
+
+    reference = runs[0]
+    for run in runs:
+        cosines = (run["embeddings"] * reference["embeddings"]).sum(axis=1)
+        tolerance = BACKEND_COSINE_TOLERANCE.get(run["backend"], 0.0)
+        run["embedding_agreement"] = {
+            "reference_backend": reference["backend"],
+            "min_cosine": round(float(cosines.min()), 6),
+            "mean_cosine": round(float(cosines.mean()), 6),
+            "tolerance": tolerance,
+            "within_tolerance": bool(cosines.min() >= 1 - tolerance - 1e-6),
+        }
+    for run in runs:
+        del run["embeddings"]
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "test_cases": len(TEST_CASES),
+        "probe_sentences": len(probe_texts()),
+        "threshold": THRESHOLD,
+        "model": "all-MiniLM-L6-v2",
+        "backends": runs,
+    }
+    with open(OUT_BACKENDS, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n  {'Backend':<12}  {'Accuracy':>8}  {'Kappa':>7}  {'p50 ms':>7}  {'p95 ms':>7}  {'RSS MB':>7}  {'min cos':>8}")
+    print(f"  {'-'*12}  {'-'*8}  {'-'*7}  {'-'*7}  {'-'*7}  {'-'*7}  {'-'*8}")
+    for run in runs:
+        agree = run["embedding_agreement"]
+        flag = "" if agree["within_tolerance"] else "  <-- outside tolerance"
+        print(f"  {run['backend']:<12}  {run['metrics']['accuracy']:>8.1%}  {run['metrics']['cohens_kappa']:>7.4f}"
+              f"  {run['p50_latency_ms']:>7.1f}  {run['p95_latency_ms']:>7.1f}  {run['peak_rss_mb']:>7.1f}"
+              f"  {agree['min_cosine']:>8.4f}{flag}")
+    print(f"\nSaved: {OUT_BACKENDS}")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# LATENCY BENCHMARK (warmup + repeats, parallel worker processes)
+# ──────────────────────────────────────────────────────────────────────────────
+
+BENCH_MODES = {
+    "exact_match":               exact_match_grade,
+    "keyword_only":              keyword_only_grade,
+    "full_pipeline":             full_pipeline_grade,
+    "full_pipeline_direct_only": direct_only_grade,
+    "full_pipeline_batched":     None,  # whole test set per batched_pipeline_grade() call
+}
+SBERT_MODES = {"full_pipeline", "full_pipeline_direct_only", "full_pipeline_batched"}
+
+# Two-sided 95% Student t critical values; t_critical() rounds df down to
+# the nearest entry, which only ever widens the interval.
+T_975 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+         9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042,
+         40: 2.021, 60: 2.000, 120: 1.980}
+BOOTSTRAP_RESAMPLES = 1000
+
+
+def t_critical(df):
+    if df >= 1000:
+        return 1.960
+    return T_975[max(k for k in T_975 if k <= df)]
+
+
+def mean_ci(samples):
+    """Mean and its 95% Student t interval."""
+    mean = statistics.fmean(samples)
+    if len(samples) < 2:
+        return mean, [mean, mean]
+    half = t_critical(len(samples) - 1) * statistics.stdev(samples) / math.sqrt(len(samples))
+    return mean, [mean - half, mean + half]
+
+
+def percentile(sorted_samples, q):
+    """Linear-interpolated q-th percentile of an already sorted list."""
+    pos = (len(sorted_samples) - 1) * q / 100
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (pos - lo)
+
+
+def bootstrap_ci(samples, stat, rng):
+    """95% percentile-bootstrap interval of stat(sorted resample)."""
+    estimates = sorted(stat(sorted(rng.choices(samples, k=len(samples))))
+                       for _ in range(BOOTSTRAP_RESAMPLES))
+    return [estimates[int(0.025 * BOOTSTRAP_RESAMPLES)], estimates[int(0.975 * BOOTSTRAP_RESAMPLES) - 1]]
+
+
+def latency_summary(samples_ms, rng):
+    """
+    mean (Student t interval), stdev, p50/p95/p99 (bootstrap intervals), in ms.
+
+    Tail percentiles need samples in the tail: with 100 cases x 10 repeats,
+    p99 rests on about 10 of them, and its interval shows it.
+    """
+    ordered = sorted(samples_ms)
+    mean, ci = mean_ci(samples_ms)
+    summary = {"n": len(samples_ms), "mean": round(mean, 4), "mean_ci95": [round(x, 4) for x in ci]}
+    if len(samples_ms) > 1:
+        summary["stdev"] = round(statistics.stdev(samples_ms), 4)
+        summary["stdev_ci95"] = [round(x, 4) for x in bootstrap_ci(samples_ms, statistics.stdev, rng)]
+    for q in (50, 95, 99):
+        summary[f"p{q}"] = round(percentile(ordered, q), 4)
+        summary[f"p{q}_ci95"] = [round(x, 4) for x in bootstrap_ci(samples_ms, lambda s: percentile(s, q), rng)]
+    return summary
+
+
+def time_pass(mode):
+    """One timed pass over TEST_CASES: (per-case ms or None, pass ms, results)."""
+    if BENCH_MODES[mode] is None:
+        t0 = time.perf_counter_ns()
+        outs = batched_pipeline_grade(TEST_CASES)
+        return None, (time.perf_counter_ns() - t0) / 1e6, outs
+
+    grade_fn = BENCH_MODES[mode]
+    case_ms = []
+    outs = []
+    t_pass = time.perf_counter_ns()
+    for tc in TEST_CASES:
+        t0 = time.perf_counter_ns()
+        outs.append(grade_fn(tc["q"], tc["student"], tc["correct"]))
+        case_ms.append((time.perf_counter_ns() - t0) / 1e6)
+    return case_ms, (time.perf_counter_ns() - t_pass) / 1e6, outs
+
+
+def bench_worker(mode, warmup, repeats):
+    """
+    Runs in its own process: warmup passes, then `repeats` timed passes.
+
+    The embedding cache is cleared before every pass, so each one measures
+    the same work (a warm model, a cold cache) instead of cache lookups.
+    """
+    load_ms = None
+    if mode in SBERT_MODES:
+        t0 = time.perf_counter_ns()
+        get_model()
+        load_ms = round((time.perf_counter_ns() - t0) / 1e6, 1)
+
+    for _ in range(warmup):
+        embedding_cache.clear()
+        time_pass(mode)
+
+    case_ms, pass_ms = [], []
+    for _ in range(repeats):
+        embedding_cache.clear()
+        per_case, total, outs = time_pass(mode)
+        pass_ms.append(total)
+        case_ms.extend(per_case or [])
+
+    rng = random.Random(0)
+    results = [{"predictedScore": out["similarityScore"], "predictedPass": out["isCorrect"],
+                "expectedScore": tc["expectedScore"], "expectedPass": tc["expectedPass"]}
+               for tc, out in zip(TEST_CASES, outs)]
+    return {
+        "mode": mode,
+        "pid": os.getpid(),
+        "model_load_ms": load_ms,
+        "warmup": warmup,
+        "repeats": repeats,
+        "metrics": compute_metrics(results),
+        "pass_ms": latency_summary(pass_ms, rng),
+        # grade_batch() has no per-case latency: report the pass spread over the cases
+        "case_ms": (latency_summary(case_ms, rng) if case_ms else
+                    {"amortized_mean": round(statistics.fmean(pass_ms) / len(TEST_CASES), 4)}),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare_bench(current, baseline):
+    """
+    Pass-time change per mode against an earlier --bench report.
+
+    The interval is Welch's on the difference of the mean pass times; a
+    change counts as a regression/improvement only when it excludes 0.
+    """
+    previous = {m["mode"]: m for m in baseline["modes"]}
+    rows = []
+    for run in current["modes"]:
+        old = previous.get(run["mode"])
+        if not old:
+            continue
+        new_p, old_p = run["pass_ms"], old["pass_ms"]
+        se2 = sum((p.get("stdev", 0.0) ** 2) / p["n"] for p in (new_p, old_p))
+        if se2:
+            df = se2 ** 2 / sum(((p.get("stdev", 0.0) ** 2) / p["n"]) ** 2 / max(p["n"] - 1, 1)
+                                for p in (new_p, old_p))
+        else:
+            df = 1000
+        delta = new_p["mean"] - old_p["mean"]
+        half = t_critical(max(1, int(df))) * math.sqrt(se2)
+        lo, hi = delta - half, delta + half
+        rows.append({
+            "mode": run["mode"],
+            "baseline_mean_ms": old_p["mean"],
+            "mean_ms": new_p["mean"],
+            "delta_ms": round(delta, 4),
+            "delta_ci95_ms": [round(lo, 4), round(hi, 4)],
+            "delta_pct": round(100 * delta / old_p["mean"], 2) if old_p["mean"] else None,
+            "verdict": "regression" if lo > 0 else "improvement" if hi < 0 else "no change",
+        })
+    return rows
+
+
+def run_bench(modes, warmup, repeats, parallel, baseline_path=None):
+    print("=" * 65)
+    print("  Speechify -- Grading Latency Benchmark")
+    print(f"  Modes: {', '.join(modes)}")
+    print(f"  Warmup: {warmup}  |  Repeats: {repeats}  |  Parallel workers: {parallel}")
+    print("=" * 65)
+
+    # Like a service worker, each process runs torch on one thread (see app.py),
+    # so workers only compete once there are more of them than cores
+    if parallel > (os.cpu_count() or 1):
+        print(f"  WARNING: {parallel} workers on {os.cpu_count()} CPUs -- latencies will include contention")
+    # spawn, not fork: each worker imports app.py and loads its own model
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=ctx) as pool:
+        futures = [pool.submit(bench_worker, mode, warmup, repeats) for mode in modes]
+        runs = [f.result() for f in futures]
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "test_cases": len(TEST_CASES),
+        "threshold": THRESHOLD,
+        "backend": SBERT_BACKEND,
+        "parallel": parallel,
+        "modes": runs,
+    }
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            report["comparison"] = compare_bench(report, json.load(f))
+        report["baseline"] = str(baseline_path)
+
+    with open(OUT_BENCH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n  {'Mode':<26}  {'pass ms':>9}  {'95% CI':>19}  {'case p50':>8}  {'p95':>7}  {'p99':>7}")
+    print(f"  {'-'*26}  {'-'*9}  {'-'*19}  {'-'*8}  {'-'*7}  {'-'*7}")
+    for run in runs:
+        p, c = run["pass_ms"], run["case_ms"]
+        ci = f"[{p['mean_ci95'][0]:.1f}, {p['mean_ci95'][1]:.1f}]"
+        if "p50" in c:
+            tail = f"{c['p50']:>8.3f}  {c['p95']:>7.3f}  {c['p99']:>7.3f}"
+        else:
+            tail = f"{c['amortized_mean']:>8.3f}  (amortized, one batch)"
+        print(f"  {run['mode']:<26}  {p['mean']:>9.2f}  {ci:>19}  {tail}")
+
+    if "comparison" in report:
+        print(f"\n  vs {baseline_path}:")
+        for row in report["comparison"]:
+            lo, hi = row["delta_ci95_ms"]
+            print(f"  {row['mode']:<26}  {row['delta_pct']:>+7.2f}%  [{lo:+.2f}, {hi:+.2f}] ms  {row['verdict']}")
+    print(f"\nSaved: {OUT_BENCH}")
+    return report
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Speechify grading pipeline evaluation")
+    parser.add_argument("--compare-backends", nargs="+", metavar="BACKEND",
+                        help="compare SBERT inference backends, e.g. torch onnx-int8")
+    parser.add_argument("--backend-worker", metavar="OUT", help=argparse.SUPPRESS)
+    parser.add_argument("--bench", nargs="*", metavar="MODE", choices=list(BENCH_MODES),
+                        help=f"latency benchmark of the given modes (default: all of {', '.join(BENCH_MODES)})")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed passes per mode (--bench)")
+    parser.add_argument("--repeats", type=int, default=10, help="timed passes per mode (--bench)")
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="modes benchmarked at once, one process each (--bench)")
+    parser.add_argument("--baseline", type=Path, help="earlier grading_bench_report.json to compare with (--bench)")
+    args = parser.parse_args()
+
+    if args.backend_worker:
+        backend_worker(args.backend_worker)
+        return
+    if args.compare_backends:
+        compare_backends(args.compare_backends)
+        return
+    if args.bench is not None:
+        run_bench(args.bench or list(BENCH_MODES), args.warmup, max(1, args.repeats),
+                  max(1, args.parallel), args.baseline)
+        return
+
     print("=" * 65)
     print("  Speechify -- Grading Pipeline Evaluation")
     print("  Test cases: 100  |  Threshold: 0.75")
@@ -322,9 +736,26 @@ def main():
     m2 = run_mode("keyword_only", keyword_only_grade)
     print(f"      Accuracy: {m2['metrics']['accuracy']:.1%}")
 
+    # Each SBERT mode starts from an empty embedding cache so latencies compare fairly
     print("\n[4/4] Running Mode 3: Full 6-Layer Pipeline (SBERT) ...")
+    embedding_cache.clear()
     m3 = run_mode("full_pipeline", full_pipeline_grade)
     print(f"      Accuracy: {m3['metrics']['accuracy']:.1%}")
+    print(f"      SBERT skipped: {m3['sbert_skip_rate']:.1%} of answers")
+
+    print("\n      ... and with the context-aware channel disabled ...")
+    embedding_cache.clear()
+    m3d = run_mode("full_pipeline_direct_only", direct_only_grade)
+    print(f"      Accuracy: {m3d['metrics']['accuracy']:.1%}")
+
+    context_tradeoff = {
+        "accuracy_delta":     round(m3d["metrics"]["accuracy"] - m3["metrics"]["accuracy"], 4),
+        "kappa_delta":        round(m3d["metrics"]["cohens_kappa"] - m3["metrics"]["cohens_kappa"], 4),
+        "mae_delta":          round(m3d["metrics"]["mae"] - m3["metrics"]["mae"], 4),
+        "avg_latency_ms_delta": round(m3d["avg_latency_ms"] - m3["avg_latency_ms"], 2),
+        "p95_latency_ms_delta": round(m3d["p95_latency_ms"] - m3["p95_latency_ms"], 2),
+        "avg_latency_speedup":  round(m3["avg_latency_ms"] / m3d["avg_latency_ms"], 2) if m3d["avg_latency_ms"] else None,
+    }
 
     # -- Build summary --
     report = {
@@ -336,7 +767,9 @@ def main():
             "exact_match":   m1,
             "keyword_only":  m2,
             "full_pipeline": m3,
+            "full_pipeline_direct_only": m3d,
         },
+        "context_channel_tradeoff": context_tradeoff,
     }
 
     # -- Save JSON --
@@ -369,6 +802,14 @@ Model      : all-MiniLM-L6-v2 (22.7M params, 384-dim)
   {"Avg Latency":<18}  {m1["avg_latency_ms"]:<12.1f}ms  {m2["avg_latency_ms"]:<12.1f}ms  {m3["avg_latency_ms"]:.1f}ms
   {"P95 Latency":<18}  {m1["p95_latency_ms"]:<12.1f}ms  {m2["p95_latency_ms"]:<12.1f}ms  {m3["p95_latency_ms"]:.1f}ms
 
+====================================================================
+  DECIDING LAYER (Full Pipeline)
+====================================================================
+"""
+    for layer, count in sorted(m3["layer_counts"].items(), key=lambda kv: -kv[1]):
+        txt += f"  {layer:<20}  n={count:>3d}\n"
+    txt += f"""  SBERT skipped       : {m3["sbert_skip_rate"]:.1%} of answers
+
 ====================================================================
   PER-CATEGORY ACCURACY (Full Pipeline)
 ====================================================================
@@ -384,6 +825,18 @@ Model      : all-MiniLM-L6-v2 (22.7M params, 384-dim)
   Actually PASS     {m3["metrics"]["confusion_matrix"]["TP"]:>6d} (TP)       {m3["metrics"]["confusion_matrix"]["FN"]:>6d} (FN)
   Actually FAIL     {m3["metrics"]["confusion_matrix"]["FP"]:>6d} (FP)       {m3["metrics"]["confusion_matrix"]["TN"]:>6d} (TN)
 
+====================================================================
+  CONTEXT-AWARE CHANNEL TRADEOFF (Full Pipeline)
+====================================================================
+
+  {"Metric":<18}  {"With Context":<14}  Direct Only
+  {"-"*18}  {"-"*14}  {"-"*14}
+  {"Accuracy":<18}  {m3["metrics"]["accuracy"]:<14.1%}  {m3d["metrics"]["accuracy"]:.1%}
+  {"Cohen's Kappa":<18}  {m3["metrics"]["cohens_kappa"]:<14.4f}  {m3d["metrics"]["cohens_kappa"]:.4f}
+  {"MAE":<18}  {m3["metrics"]["mae"]:<14.4f}  {m3d["metrics"]["mae"]:.4f}
+  {"Avg Latency":<18}  {m3["avg_latency_ms"]:<12.1f}ms  {m3d["avg_latency_ms"]:.1f}ms
+  {"P95 Latency":<18}  {m3["p95_latency_ms"]:<12.1f}ms  {m3d["p95_latency_ms"]:.1f}ms
+
 Full report: grading_eval_report.json
 """
 
@@ -27,8 +27,10 @@ def test_health():
         response = requests.get(f"{SBERT_URL}/health", timeout=5)
         if response.status_code == 200:
             data = response.json()
+            cache = data.get('embeddingCache', {})
             print_result("Health Check", True, 
-                        f"Model: {data.get('model')}, Status: {data.get('status')}")
+                        f"Model: {data.get('model')}, Status: {data.get('status')}, "
+                        f"Cache hits/misses: {cache.get('hits')}/{cache.get('misses')}")
             return True
         else:
             print_result("Health Check", False, f"Status code: {response.status_code}")
@@ -197,6 +199,116 @@ def test_batch_grading():
         print_result("Batch Grading Test", False, f"Error: {str(e)}")
         return False
 
+def test_batch_grading_stream():
+    """Test NDJSON streaming mode of the batch grading endpoint"""
+    data = {
+        "threshold": 0.85,
+        "answers": [
+            {
+                "questionText": "What is photosynthesis?",
+                "studentAnswer": "process where plants make food from sunlight",
+                "correctAnswer": "process by which plants convert light energy into chemical energy"
+            },
+            {
+                "questionText": "Capital of France?",
+                "studentAnswer": "Paris",
+                "correctAnswer": "Paris"
+            }
+        ]
+    }
+    
+    try:
+        response = requests.post(f"{SBERT_URL}/batch-grade", json=data, timeout=10,
+                                 headers={"Accept": "application/x-ndjson"}, stream=True)
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+        
+        passed = (response.headers.get('Content-Type', '').startswith('application/x-ndjson')
+                  and sorted(r['index'] for r in lines) == [0, 1])
+        print_result("Batch Grading Stream Test", passed,
+                    f"Received {len(lines)} lines in order {[r['index'] for r in lines]}")
+        return passed
+    except Exception as e:
+        print_result("Batch Grading Stream Test", False, f"Error: {str(e)}")
+        return False
+
+def test_batch_matches_single():
+    """Test that /batch-grade returns the same grades as individual /grade calls"""
+    answers = [
+        {
+            "questionText": "What is photosynthesis?",
+            "studentAnswer": "process where plants make food from sunlight",
+            "correctAnswer": "process by which plants convert light energy into chemical energy"
+        },
+        {
+            "questionText": "What is the capital of France?",
+            "studentAnswer": "London",
+            "correctAnswer": "Paris"
+        },
+        {
+            "questionText": "What is 2 + 2?",
+            "studentAnswer": "4",
+            "correctAnswer": "4"
+        },
+        {
+            "questionText": "What is photosynthesis?",
+            "studentAnswer": "",
+            "correctAnswer": "process by which plants convert light energy"
+        }
+    ]
+    
+    try:
+        response = requests.post(f"{SBERT_URL}/batch-grade",
+                                 json={"threshold": 0.70, "answers": answers}, timeout=10)
+        batch = response.json()['results']
+        
+        mismatches = []
+        for item, batch_result in zip(answers, batch):
+            single = requests.post(f"{SBERT_URL}/grade",
+                                   json={**item, "threshold": 0.70}, timeout=10).json()
+            if (single['similarityScore'] != batch_result['similarityScore']
+                    or single['isCorrect'] != batch_result['isCorrect']):
+                mismatches.append(batch_result['index'])
+        
+        passed = len(batch) == len(answers) and not mismatches
+        print_result("Batch/Single Consistency Test", passed,
+                    f"Mismatched indexes: {mismatches}" if mismatches else f"{len(batch)} results identical")
+        return passed
+    except Exception as e:
+        print_result("Batch/Single Consistency Test", False, f"Error: {str(e)}")
+        return False
+
+def test_prepared_quiz():
+    """Test that grading against a prepared quiz matches grading with full texts"""
+    question = {
+        "questionId": 1,
+        "questionText": "What is photosynthesis?",
+        "correctAnswer": "process by which plants convert light energy into chemical energy"
+    }
+    student_answer = "process where plants make food from sunlight"
+    
+    try:
+        response = requests.post(f"{SBERT_URL}/prepare",
+                                 json={"quizId": "test-quiz", "questions": [question]}, timeout=10)
+        prepared = response.json()
+        
+        by_ref = requests.post(f"{SBERT_URL}/grade", json={
+            "quizId": "test-quiz", "questionId": 1,
+            "studentAnswer": student_answer, "threshold": 0.70
+        }, timeout=10).json()
+        by_text = requests.post(f"{SBERT_URL}/grade", json={
+            "questionText": question["questionText"], "correctAnswer": question["correctAnswer"],
+            "studentAnswer": student_answer, "threshold": 0.70
+        }, timeout=10).json()
+        
+        passed = prepared.get('prepared') == 1 and by_ref['similarityScore'] == by_text['similarityScore']
+        print_result("Prepared Quiz Test", passed,
+                    f"Prepared: {prepared.get('prepared')}, Score by ref: {by_ref['similarityScore']:.4f}, "
+                    f"by text: {by_text['similarityScore']:.4f}")
+        return passed
+    except Exception as e:
+        print_result("Prepared Quiz Test", False, f"Error: {str(e)}")
+        return False
+
 def main():
     """Run all tests"""
     print(f"\n{Fore.CYAN}{'='*60}")
@@ -214,6 +326,9 @@ def main():
         ("Incorrect Answer", test_incorrect_answer),
         ("Empty Answer", test_empty_answer),
         ("Batch Grading", test_batch_grading),
+        ("Batch Grading Stream", test_batch_grading_stream),
+        ("Batch/Single Consistency", test_batch_matches_single),
+        ("Prepared Quiz", test_prepared_quiz),
     ]
     
     results = []
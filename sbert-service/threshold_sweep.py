@@ -1,34 +1,498 @@
+#!/usr/bin/env python3
+"""
+Speechify — Threshold Sweep & Score Calibration
+================================================
+Finds the pass threshold that maximises each decision metric and fits a
+calibration of `similarityScore` to the probability that a human grader
+passes the answer.
+
+Every distinct score is a candidate threshold (pass iff score >= threshold,
+as in the service), plus one just above the highest score that fails every
+answer. Scores are sorted once and the confusion counts at every
+threshold come from cumulative sums, so a full ROC / precision-recall curve
+costs one sort: 100k+ labelled answers take well under a second.
+
+Input (one of):
+  grading_eval_report.json    ← default; per_case of --mode (full_pipeline)
+  any .json list / .jsonl / .csv of labelled rows with a score
+                                (predictedScore | similarityScore | score),
+                                a label (expectedPass | gold | label) and,
+                                optionally, a category (category | cat)
+  --run                       ← grade the grading_eval.py test set first
+
+Output:
+  threshold_sweep_report.json ← curves, best thresholds, per-category, calibration
+  score_calibration.json      ← table for the service: SBERT_CALIBRATION_FILE=...
+
+Calibration is isotonic (pool-adjacent-violators) or Platt (logistic on the
+score); `--method auto` keeps whichever has the lower cross-validated Brier
+score.
+
+Run from sbert-service/:
+  python threshold_sweep.py
+  python threshold_sweep.py --report labelled_answers.jsonl --method isotonic
+  python threshold_sweep.py --run
+"""
+
+import argparse
+import csv
 import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+OUT_DIR = Path(__file__).resolve().parent
+DEFAULT_REPORT = OUT_DIR / "grading_eval_report.json"
+OUT_JSON = OUT_DIR / "threshold_sweep_report.json"
+OUT_CALIBRATION = OUT_DIR / "score_calibration.json"
+
+SCORE_FIELDS = ("predictedScore", "similarityScore", "similarity_score", "score")
+LABEL_FIELDS = ("expectedPass", "gold", "label")
+CATEGORY_FIELDS = ("category", "cat")
+
+# Reported per threshold; best_thresholds() maximises each of these
+METRICS = ("accuracy", "precision", "recall", "f1", "kappa", "youden_j", "balanced_accuracy")
+OPTIMISED = ("accuracy", "f1", "kappa", "youden_j", "balanced_accuracy")
+CALIBRATION_GRID = 101  # Platt table points over [0, 1]
+ECE_BINS = 10
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# INPUT
+# ──────────────────────────────────────────────────────────────────────────────
+
+def read_rows(path, mode):
+    """
+    (rows, threshold) from a grading_eval report or a plain .json/.jsonl/.csv
+    file; threshold is the report's own, or None.
+    """
+    path = Path(path)
+    with open(path, encoding="utf-8") as f:
+        if path.suffix == ".jsonl":
+            return [json.loads(line) for line in f if line.strip()], None
+        if path.suffix == ".csv":
+            return list(csv.DictReader(f)), None
+        data = json.load(f)
+    if isinstance(data, list):
+        return data, None
+    if "modes" in data:
+        if mode not in data["modes"]:
+            raise SystemExit(f"{path}: no mode '{mode}' (have: {', '.join(data['modes'])})")
+        return data["modes"][mode]["per_case"], data.get("threshold")
+    if "per_case" in data:
+        return data["per_case"], data.get("threshold")
+    raise SystemExit(f"{path}: no per-case scores found (expected 'modes', 'per_case' or a list of rows)")
+
+
+def _field(row, names, required=True):
+    for name in names:
+        if name in row:
+            return name
+    if required:
+        raise SystemExit(f"rows need one of {', '.join(names)}; got {', '.join(row)}")
+    return None
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "pass")
+    return bool(value)
+
+
+def to_arrays(rows):
+    """(scores float64, labels bool, categories or None) for a list of rows."""
+    if not rows:
+        raise SystemExit("no labelled rows to analyse")
+    score_f = _field(rows[0], SCORE_FIELDS)
+    label_f = _field(rows[0], LABEL_FIELDS)
+    cat_f = _field(rows[0], CATEGORY_FIELDS, required=False)
+    scores = np.fromiter((float(r[score_f]) for r in rows), dtype=np.float64, count=len(rows))
+    labels = np.fromiter((_as_bool(r[label_f]) for r in rows), dtype=bool, count=len(rows))
+    categories = np.array([str(r.get(cat_f, "")) for r in rows]) if cat_f else None
+    return scores, labels, categories
+
+
+def run_pipeline():
+    """Grade the grading_eval.py test set with the full pipeline; (rows, threshold)."""
+    # Imported here: loading app.py pulls in torch and the SBERT model
+    from grading_eval import THRESHOLD, full_pipeline_grade, get_model, run_mode
+
+    get_model()
+    return run_mode("full_pipeline", full_pipeline_grade)["per_case"], THRESHOLD
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CURVES
+# ──────────────────────────────────────────────────────────────────────────────
+
+def confusion_curve(scores, labels):
+    """
+    Confusion counts at every distinct score, highest threshold first.
+
+    Sorting by descending score makes "pass iff score >= t" a prefix of the
+    array, so the counts at each threshold are cumulative sums read at the
+    last position of every run of equal scores. Row 0 is the "reject all"
+    point, a threshold just above the highest score.
+    """
+    order = np.argsort(-scores, kind="stable")
+    s, y = scores[order], labels[order]
+    last = np.flatnonzero(np.r_[s[1:] != s[:-1], True])
+    tp = np.r_[0, np.cumsum(y)[last]]
+    fp = np.r_[0, last + 1] - tp
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    return {"threshold": np.r_[np.nextafter(s[0], np.inf), s[last]], "tp": tp, "fp": fp,
+            "fn": positives - tp, "tn": negatives - fp}
+
+
+def _ratio(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape), where=b != 0)
+
+
+def threshold_metrics(c):
+    """Every METRICS entry as an array aligned with c["threshold"]."""
+    tp, fp, fn, tn = c["tp"], c["fp"], c["fn"], c["tn"]
+    n = tp + fp + fn + tn
+    accuracy = _ratio(tp + tn, n)
+    recall = _ratio(tp, tp + fn)
+    specificity = _ratio(tn, tn + fp)
+    # Cohen's kappa, as compute_metrics() in grading_eval.py
+    pe = _ratio((tp + fp) * (tp + fn) + (fn + tn) * (fp + tn), n * n)
+    return {
+        "accuracy": accuracy,
+        "precision": _ratio(tp, tp + fp),
+        "recall": recall,
+        "f1": _ratio(2 * tp, 2 * tp + fp + fn),
+        "kappa": _ratio(accuracy - pe, 1 - pe),
+        "youden_j": recall + specificity - 1,
+        "balanced_accuracy": (recall + specificity) / 2,
+    }
+
+
+def curve_areas(c):
+    """ROC AUC and average precision (None when only one class is present)."""
+    positives = c["tp"][-1] + c["fn"][-1]
+    negatives = c["fp"][-1] + c["tn"][-1]
+    if not positives or not negatives:
+        return None, None
+    # Row 0 (reject all) is the (0, 0) corner of both curves
+    tpr = c["tp"] / positives
+    fpr = c["fp"] / negatives
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    precision = _ratio(c["tp"], c["tp"] + c["fp"])
+    average_precision = float(np.sum(np.diff(tpr) * precision[1:]))
+    return round(roc_auc, 4), round(average_precision, 4)
+
+
+def best_thresholds(c, m):
+    """
+    Per OPTIMISED metric: the threshold with the best value and its confusion counts.
+
+    Ties go to the highest such threshold (the strictest grading); `rejectsAll`
+    marks the point above every score. Thresholds are not rounded, since
+    rounding can move them across a score.
+    """
+    best = {}
+    for name in OPTIMISED:
+        i = int(np.argmax(m[name]))
+        best[name] = {
+            "threshold": float(c["threshold"][i]),
+            "rejectsAll": i == 0,
+            "value": round(float(m[name][i]), 4),
+            **{k: int(c[k][i]) for k in ("tp", "fp", "fn", "tn")},
+        }
+    return best
+
+
+def at_threshold(scores, labels, threshold):
+    """METRICS and confusion counts for a single threshold."""
+    passed = scores >= threshold
+    c = {"tp": np.array([np.sum(passed & labels)]), "fp": np.array([np.sum(passed & ~labels)]),
+         "fn": np.array([np.sum(~passed & labels)]), "tn": np.array([np.sum(~passed & ~labels)])}
+    m = threshold_metrics(c)
+    return {"threshold": threshold, **{k: round(float(v[0]), 4) for k, v in m.items()},
+            **{k: int(v[0]) for k, v in c.items()}}
+
+
+def analyse(scores, labels, threshold):
+    """Best thresholds, AUCs, the current threshold and the full curves for one set of answers."""
+    c = confusion_curve(scores, labels)
+    m = threshold_metrics(c)
+    roc_auc, average_precision = curve_areas(c)
+    positives = int(labels.sum())
+    # With one class only, "pass everything" / "fail everything" is trivially
+    # best and says nothing about where the threshold belongs
+    single_class = None
+    if positives in (0, len(scores)):
+        single_class = "pass" if positives else "fail"
+    return {
+        "n": len(scores),
+        "positives": positives,
+        "distinct_scores": len(c["threshold"]) - 1,
+        "roc_auc": roc_auc,
+        "average_precision": average_precision,
+        "single_class": single_class,
+        "at_current_threshold": at_threshold(scores, labels, threshold),
+        "best_thresholds": None if single_class else best_thresholds(c, m),
+    }, c, m
+
+
+def category_breakdown(scores, labels, categories, threshold):
+    names, inverse = np.unique(categories, return_inverse=True)
+    breakdown = {}
+    for k, name in enumerate(names):
+        mask = inverse == k
+        summary, _, _ = analyse(scores[mask], labels[mask], threshold)
+        breakdown[str(name)] = summary
+    return breakdown
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CALIBRATION
+# ──────────────────────────────────────────────────────────────────────────────
+
+def isotonic_fit(scores, labels):
+    """
+    Pool-adjacent-violators fit of P(pass | score); returns the table points.
+
+    Equal scores are pooled first, so the loop runs once per distinct score.
+    Each fitted block contributes its first and last score, and the service
+    interpolates linearly between blocks.
+    """
+    xs, inverse = np.unique(scores, return_inverse=True)
+    weights = np.bincount(inverse).astype(np.float64)
+    sums = np.bincount(inverse, weights=labels.astype(np.float64))
+
+    block_sum, block_weight, block_start = [], [], []
+    for i in range(len(xs)):
+        s, w, start = sums[i], weights[i], i
+        while block_sum and block_sum[-1] * w >= s * block_weight[-1]:
+            s += block_sum.pop()
+            w += block_weight.pop()
+            start = block_start.pop()
+        block_sum.append(s)
+        block_weight.append(w)
+        block_start.append(start)
+
+    points = []
+    ends = block_start[1:] + [len(xs)]
+    for s, w, start, end in zip(block_sum, block_weight, block_start, ends):
+        points.append([float(xs[start]), s / w])
+        if end - 1 > start:
+            points.append([float(xs[end - 1]), s / w])
+    return points
+
+
+def _sigmoid(z):
+    return np.exp(-np.logaddexp(0.0, -z))
+
+
+def platt_fit(scores, labels, max_iter=100):
+    """
+    Platt scaling: P(pass) = sigmoid(a * score + b), fitted by Newton's method.
+
+    Uses Platt's smoothed targets ((P+1)/(P+2) and 1/(N+2)) so that a
+    separable set does not drive the slope to infinity.
+    """
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    target = np.where(labels, (positives + 1) / (positives + 2), 1 / (negatives + 2))
+    a, b = 0.0, float(np.log((positives + 1) / (negatives + 1)))
+    for _ in range(max_iter):
+        p = _sigmoid(a * scores + b)
+        r = p - target
+        w = p * (1 - p)
+        gradient = np.array([np.dot(r, scores), r.sum()])
+        hessian = np.array([[np.dot(w, scores * scores), np.dot(w, scores)],
+                            [np.dot(w, scores), w.sum()]]) + 1e-12 * np.eye(2)
+        step = np.linalg.solve(hessian, gradient)
+        a, b = a - step[0], b - step[1]
+        if np.abs(step).max() < 1e-10:
+            break
+    return float(a), float(b)
+
+
+def platt_points(a, b):
+    grid = np.linspace(0.0, 1.0, CALIBRATION_GRID)
+    return [[float(x), float(p)] for x, p in zip(grid, _sigmoid(a * grid + b))]
+
+
+def apply_points(points, scores):
+    """What ScoreCalibration in app.py returns, vectorised."""
+    xs, ys = np.asarray(points, dtype=np.float64).T
+    return np.interp(scores, xs, ys)
+
+
+def fit_points(method, scores, labels):
+    if method == "isotonic":
+        return isotonic_fit(scores, labels), {}
+    a, b = platt_fit(scores, labels)
+    return platt_points(a, b), {"a": round(a, 6), "b": round(b, 6)}
+
+
+def probability_scores(probabilities, labels):
+    """Brier score, log loss and expected calibration error."""
+    y = labels.astype(np.float64)
+    p = np.clip(probabilities, 1e-6, 1 - 1e-6)
+    bins = np.minimum((probabilities * ECE_BINS).astype(int), ECE_BINS - 1)
+    counts = np.bincount(bins, minlength=ECE_BINS)
+    gap = np.abs(np.bincount(bins, weights=probabilities, minlength=ECE_BINS)
+                 - np.bincount(bins, weights=y, minlength=ECE_BINS))
+    return {
+        "brier": round(float(np.mean((probabilities - y) ** 2)), 4),
+        "log_loss": round(float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))), 4),
+        "ece": round(float(gap.sum() / counts.sum()), 4),
+    }
+
+
+def cross_validated(method, scores, labels, folds, seed=0):
+    """Out-of-fold calibrated probabilities (None when the set is too small to split)."""
+    if folds < 2 or len(scores) < 2 * folds:
+        return None
+    fold = np.random.default_rng(seed).permutation(len(scores)) % folds
+    out = np.empty(len(scores))
+    for k in range(folds):
+        test = fold == k
+        train = ~test
+        if labels[train].all() or not labels[train].any():
+            return None
+        points, _ = fit_points(method, scores[train], labels[train])
+        out[test] = apply_points(points, scores[test])
+    return out
+
+
+def calibrate(scores, labels, method, folds):
+    """Fit isotonic and Platt; return (report, chosen method, table points, params)."""
+    report = {"uncalibrated": probability_scores(np.clip(scores, 0.0, 1.0), labels)}
+    fits = {}
+    for name in ("isotonic", "platt"):
+        points, params = fit_points(name, scores, labels)
+        fits[name] = (points, params)
+        oof = cross_validated(name, scores, labels, folds)
+        report[name] = {
+            **params,
+            "points": len(points),
+            "in_sample": probability_scores(apply_points(points, scores), labels),
+            "cross_validated": probability_scores(oof, labels) if oof is not None else None,
+        }
+    if method == "auto":
+        key = "cross_validated" if all(report[m]["cross_validated"] for m in fits) else "in_sample"
+        method = min(fits, key=lambda m: report[m][key]["brier"])
+    report["chosen"] = method
+    return report, method, *fits[method]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# MAIN
+# ──────────────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Speechify threshold sweep and score calibration")
+    parser.add_argument("--report", type=Path, default=DEFAULT_REPORT,
+                        help="grading_eval report or labelled .json/.jsonl/.csv rows")
+    parser.add_argument("--mode", default="full_pipeline", help="grading_eval mode to read (default: full_pipeline)")
+    parser.add_argument("--run", action="store_true", help="grade the grading_eval.py test set instead of reading --report")
+    parser.add_argument("--threshold", type=float, help="current threshold (default: the report's, else 0.5)")
+    parser.add_argument("--method", choices=("auto", "isotonic", "platt"), default="auto")
+    parser.add_argument("--cv-folds", type=int, default=5, help="folds for the calibration comparison")
+    parser.add_argument("--out", type=Path, default=OUT_JSON)
+    parser.add_argument("--calibration-out", type=Path, default=OUT_CALIBRATION)
+    args = parser.parse_args()
+
+    if args.run:
+        rows, threshold = run_pipeline()
+        source = "grading_eval.py --run"
+    else:
+        rows, threshold = read_rows(args.report, args.mode)
+        source = str(args.report)
+    if args.threshold is not None:
+        threshold = args.threshold
+    elif threshold is None:
+        threshold = 0.5
 
-r = json.load(open("grading_eval_report.json"))
-cases = r["modes"]["full_pipeline"]["per_case"]
+    t0 = time.perf_counter()
+    scores, labels, categories = to_arrays(rows)
+    summary, c, m = analyse(scores, labels, threshold)
+    categories_report = (category_breakdown(scores, labels, categories, threshold)
+                         if categories is not None else {})
+    calibration, method, points, params = calibrate(scores, labels, args.method, args.cv_folds)
+    elapsed = time.perf_counter() - t0
 
-thresholds = [0.35, 0.40, 0.45, 0.50, 0.55, 0.60, 0.65, 0.70, 0.75]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "source": source,
+        "mode": None if args.run else args.mode,
+        "analysis_seconds": round(elapsed, 3),
+        **summary,
+        "categories": categories_report,
+        "calibration": calibration,
+        "curves": {
+            # Unrounded: rounding would fold the reject-all row onto the top score
+            "threshold": c["threshold"].tolist(),
+            **{k: c[k].tolist() for k in ("tp", "fp", "fn", "tn")},
+            **{k: np.round(m[k], 4).tolist() for k in ("precision", "recall")},
+            "fpr": np.round(_ratio(c["fp"], c["fp"] + c["tn"]), 4).tolist(),
+        },
+    }
+    table = {
+        "method": method,
+        "fitted_at": report["timestamp"],
+        "source": source,
+        "n": summary["n"],
+        "positives": summary["positives"],
+        **params,
+        "brier": calibration[method]["in_sample"]["brier"],
+        "points": [[round(x, 6), round(y, 6)] for x, y in points],
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(args.calibration_out, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=2)
 
-print(f"{'Thresh':>8} {'Accuracy':>10} {'Precision':>10} {'Recall':>10} {'F1':>10} {'FP':>5} {'FN':>5}")
-print("-" * 62)
+    print(f"Analysed {summary['n']} answers ({summary['distinct_scores']} distinct scores, "
+          f"{summary['positives']} pass) from {source} in {elapsed:.3f}s")
+    print(f"ROC AUC: {summary['roc_auc']}   Average precision: {summary['average_precision']}\n")
 
-best_f1 = 0
-best_t = 0
+    print(f"{'Best for':>18} {'Thresh':>8} {'Accuracy':>10} {'Precision':>10} {'Recall':>10} {'F1':>10} {'FP':>6} {'FN':>6}")
+    print("-" * 84)
+    rows_out = [("current", summary["at_current_threshold"], False)]
+    for name, best in (summary["best_thresholds"] or {}).items():
+        rows_out.append((name, at_threshold(scores, labels, best["threshold"]), best["rejectsAll"]))
+    for name, r, rejects_all in rows_out:
+        thresh = f"{'> max':>8}" if rejects_all else f"{r['threshold']:>8.4f}"
+        print(f"{name:>18} {thresh} {r['accuracy']:>10.1%} {r['precision']:>10.1%} "
+              f"{r['recall']:>10.1%} {r['f1']:>10.1%} {r['fp']:>6d} {r['fn']:>6d}")
+    if summary["single_class"]:
+        print(f"{'':>18} (every answer is labelled {summary['single_class']}: no best threshold)")
 
-for t in thresholds:
-    tp = sum(1 for c in cases if c["predictedScore"] >= t and c["expectedPass"])
-    fp = sum(1 for c in cases if c["predictedScore"] >= t and not c["expectedPass"])
-    fn = sum(1 for c in cases if c["predictedScore"] < t and c["expectedPass"])
-    tn = sum(1 for c in cases if c["predictedScore"] < t and not c["expectedPass"])
+    if categories_report:
+        print(f"\n{'Category':>18} {'n':>6} {'pass':>6} {'acc@cur':>8} {'best acc':>9} {'at':>8} {'best F1':>8} {'at':>8}")
+        print("-" * 84)
+        for name, cat in categories_report.items():
+            line = f"{name:>18} {cat['n']:>6d} {cat['positives']:>6d} {cat['at_current_threshold']['accuracy']:>8.1%} "
+            if cat["single_class"]:
+                print(line + f"  all labelled {cat['single_class']}: no best threshold")
+                continue
+            for best in (cat["best_thresholds"]["accuracy"], cat["best_thresholds"]["f1"]):
+                at = "> max" if best["rejectsAll"] else f"{best['threshold']:.4f}"
+                line += f"{best['value']:>9.1%} {at:>8} "
+            print(line.rstrip())
 
-    n = len(cases)
-    acc = (tp + tn) / n
-    prec = tp / (tp + fp) if (tp + fp) else 0
-    rec = tp / (tp + fn) if (tp + fn) else 0
-    f1 = 2 * prec * rec / (prec + rec) if (prec + rec) else 0
+    print(f"\n{'Calibration':>18} {'Brier':>8} {'LogLoss':>8} {'ECE':>8} {'CV Brier':>9}")
+    print("-" * 56)
+    for name in ("uncalibrated", "isotonic", "platt"):
+        entry = calibration[name]
+        fit = entry.get("in_sample", entry)
+        cv = entry.get("cross_validated")
+        cv_brier = f"{cv['brier']:>9.4f}" if cv else f"{'-':>9}"
+        print(f"{name:>18} {fit['brier']:>8.4f} {fit['log_loss']:>8.4f} {fit['ece']:>8.4f} {cv_brier}")
 
-    marker = ""
-    if f1 > best_f1:
-        best_f1 = f1
-        best_t = t
-        marker = " <-- best F1"
+    print(f"\nSaved:\n  {args.out}\n  {args.calibration_out}  ({method}, {len(points)} points; "
+          f"SBERT_CALIBRATION_FILE={args.calibration_out.name})")
 
-    print(f"{t:>8.2f} {acc:>10.1%} {prec:>10.1%} {rec:>10.1%} {f1:>10.1%} {fp:>5d} {fn:>5d}{marker}")
 
-print(f"\nOptimal threshold: {best_t} (F1 = {best_f1:.1%})")
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,1237 @@
+import asyncio
+import bisect
+import hashlib
+import io
+import json
+import math
 import os
-import shutil
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import re
+import resource
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from contextlib import contextmanager
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+import numpy as np
 import uvicorn
-from faster_whisper import WhisperModel
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
 
 # Fix OpenMP library conflict
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
 app = FastAPI(title="Whisper Transcription Service", version="1.0.0")
 
-# Configure upload folder
-UPLOAD_FOLDER = '/tmp/uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Uploads are never written under their client filename. Each one lives in its
+# own SpooledTemporaryFile (created by the multipart parser) that stays in
+# memory up to this size and only rolls over to an anonymous temp file above it.
+SPOOL_MAX_BYTES = int(os.environ.get('WHISPER_SPOOL_MAX_BYTES', str(4 * 1024 * 1024)))
+MultiPartParser.spool_max_size = SPOOL_MAX_BYTES
 
-# Initialize Whisper model (loaded once at startup)
-model = None
+# Whisper models expect 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+
+def parse_tiers(spec: str) -> dict:
+    """"fast=tiny:int8,accurate=small:int8" -> {"fast": ("tiny", "int8"), ...}"""
+    tiers = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, model = item.partition('=')
+        size, _, compute_type = model.partition(':')
+        tiers[name.strip()] = (size.strip(), compute_type.strip() or "int8")
+    return tiers
+
+
+# Model tiers requests can pick with `tier`. The default tier is loaded at
+# startup and kept loaded; the others load on first use while their estimated
+# footprint fits WHISPER_MODEL_MEMORY_MB, and are unloaded after
+# WHISPER_MODEL_IDLE_SECONDS without use (or earlier, to make room).
+# The default stays 'tiny' instead of 'base' to prevent Out Of Memory crashes on Free Tier
+MODEL_TIERS = parse_tiers(os.environ.get('WHISPER_TIERS', 'fast=tiny:int8,balanced=base:int8,accurate=small:int8'))
+DEFAULT_TIER = os.environ.get('WHISPER_DEFAULT_TIER', 'fast')
+MODEL_MEMORY_MB = float(os.environ.get('WHISPER_MODEL_MEMORY_MB', '1500'))
+MODEL_IDLE_SECONDS = float(os.environ.get('WHISPER_MODEL_IDLE_SECONDS', '600'))
+
+# Rough resident size per model: parameters (millions) x bytes per weight + runtime overhead
+MODEL_PARAMS_M = {"tiny": 39, "tiny.en": 39, "base": 74, "base.en": 74, "small": 244, "small.en": 244,
+                  "medium": 769, "medium.en": 769, "large-v3": 1550, "turbo": 809}
+BYTES_PER_WEIGHT = {"int8": 1, "int8_float16": 1, "int8_float32": 1, "int8_bfloat16": 1,
+                    "float16": 2, "bfloat16": 2, "float32": 4}
+MODEL_OVERHEAD_MB = 60
+
+# Inference runs on a bounded thread pool, never on the event loop.
+# WHISPER_NUM_WORKERS transcriptions run in parallel (CTranslate2 releases the
+# GIL), each using WHISPER_CPU_THREADS intra-op threads (0 = CTranslate2 default).
+NUM_WORKERS = int(os.environ.get('WHISPER_NUM_WORKERS', '1'))
+CPU_THREADS = int(os.environ.get('WHISPER_CPU_THREADS', '0'))
+# Requests admitted at once (running + waiting); beyond this /transcribe answers 429
+MAX_PENDING = int(os.environ.get('WHISPER_MAX_PENDING', str(4 * NUM_WORKERS)))
+
+# /transcribe-batch: clips per request, and clips per padded encoder/decoder batch
+BATCH_MAX_CLIPS = int(os.environ.get('WHISPER_BATCH_MAX_CLIPS', '32'))
+BATCH_SIZE = int(os.environ.get('WHISPER_BATCH_SIZE', '8'))
+# Whisper's window; longer clips cannot share a padded batch slot
+MAX_BATCH_CLIP_SECONDS = 30.0
+
+# Silence rejection before decoding. Clips whose loudest 20 ms frame stays
+# below the energy gate are rejected outright; the rest go through Silero VAD
+# (WHISPER_VAD=0 disables it), and only the span from the first to the last
+# speech region (padded by speech_pad_ms) is transcribed.
+ENERGY_GATE_DBFS = float(os.environ.get('WHISPER_ENERGY_GATE_DBFS', '-50'))
+VAD_ENABLED = os.environ.get('WHISPER_VAD', '1') != '0'
+VAD_OPTIONS = VadOptions(threshold=float(os.environ.get('WHISPER_VAD_THRESHOLD', '0.5')))
+ENERGY_FRAME_SAMPLES = 320
+
+# /transcribe-stream: re-transcribe the uncommitted window every STEP seconds of
+# new audio. Segments ending COMMIT_MARGIN before the window end are committed
+# and dropped from the window; past WINDOW seconds the window is force-committed.
+STREAM_STEP_SECONDS = float(os.environ.get('WHISPER_STREAM_STEP_SECONDS', '1.0'))
+STREAM_WINDOW_SECONDS = float(os.environ.get('WHISPER_STREAM_WINDOW_SECONDS', '20'))
+STREAM_COMMIT_MARGIN = float(os.environ.get('WHISPER_STREAM_COMMIT_MARGIN', '1.0'))
+# A stream longer than MAX_SECONDS of audio or MAX_BYTES received is closed
+# with 1009. Container streams are re-decoded from the start on each pass, so
+# passes are also spaced to keep decoding under DECODE_SHARE of wall time.
+STREAM_MAX_SECONDS = float(os.environ.get('WHISPER_STREAM_MAX_SECONDS', '300'))
+STREAM_MAX_BYTES = int(os.environ.get('WHISPER_STREAM_MAX_BYTES', str(32 * 1024 * 1024)))
+STREAM_DECODE_SHARE = 0.25
+
+# Decode profiles, picked per request with `profile`. "default" is faster-whisper's
+# own settings (beam search, temperature fallback, timestamps); "fast" is tuned
+# for 3-20 s answers: greedy, no timestamps, no conditioning on earlier windows
+# and capped output.
+FAST_MAX_NEW_TOKENS = int(os.environ.get('WHISPER_FAST_MAX_NEW_TOKENS', '128'))
+DECODE_PROFILES = {
+    "default": {},
+    "fast": {"beam_size": 1, "best_of": 1, "temperature": 0.0, "without_timestamps": True,
+             "condition_on_previous_text": False, "max_new_tokens": FAST_MAX_NEW_TOKENS},
+}
+DEFAULT_PROFILE = os.environ.get('WHISPER_DEFAULT_PROFILE', 'default')
+
+# Question vocabulary (see vocabulary_options): content words of the question
+# become the initial prompt, those of the expected answer the hotwords.
+PROMPT_MAX_WORDS = 40
+PROMPT_STOPWORDS = frozenset(
+    "the and for are was were what which who whom whose why how when where that this these those with "
+    "from into onto does did has have had its your you their they them there then than not but "
+    "can could would should will shall may might must been being about explain describe name give "
+    "state define list".split()
+)
+
+# A transcript is lowConfidence below this token-weighted avg_logprob or above
+# this no_speech_prob (Whisper's own log_prob / no_speech thresholds).
+LOW_CONFIDENCE_LOGPROB = float(os.environ.get('WHISPER_LOW_CONFIDENCE_LOGPROB', '-1.0'))
+LOW_CONFIDENCE_NO_SPEECH = float(os.environ.get('WHISPER_LOW_CONFIDENCE_NO_SPEECH', '0.6'))
+
+# Transcript cache (see TranscriptCache). WHISPER_CACHE_DIR adds a disk tier,
+# e.g. on a volume, so results survive restarts and are shared by workers.
+CACHE_MAX_ENTRIES = int(os.environ.get('WHISPER_CACHE_MAX_ENTRIES', '5000'))
+CACHE_MAX_BYTES = int(os.environ.get('WHISPER_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+CACHE_DIR = os.environ.get('WHISPER_CACHE_DIR', '')
+CACHE_DISK_MAX_BYTES = int(os.environ.get('WHISPER_CACHE_DISK_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_FORMAT = 2  # bump when the cached result fields change
+
+
+
+class MemoryStats:
+    """
+    Per-request memory accounting for the audio path.
+
+    A request holds its upload (when it is still in memory) plus the decode
+    buffers: the s16 PCM buffer and the float32 waveform, 6 bytes per sample.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.spooled_to_disk = 0
+        self.last_request_bytes = 0
+        self.peak_request_bytes = 0
+
+    def record(self, upload_bytes: int, samples: int) -> int:
+        in_memory = upload_bytes <= SPOOL_MAX_BYTES
+        request_bytes = (upload_bytes if in_memory else 0) + samples * 6
+        with self._lock:
+            self.requests += 1
+            self.spooled_to_disk += not in_memory
+            self.last_request_bytes = request_bytes
+            self.peak_request_bytes = max(self.peak_request_bytes, request_bytes)
+        return request_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "spooledToDisk": self.spooled_to_disk,
+                "spoolMaxBytes": SPOOL_MAX_BYTES,
+                "lastRequestBytes": self.last_request_bytes,
+                "peakRequestBytes": self.peak_request_bytes,
+                # ru_maxrss is reported in KiB on Linux
+                "peakRssBytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            }
+
+
+memory_stats = MemoryStats()
+
+
+class InferenceExecutor:
+    """
+    Bounded pool for blocking decode + transcribe work, with admission control.
+
+    Admission and release happen on the event loop, so the counters need no lock.
+    Retry-After is estimated from the queue depth and a running average of
+    how long a transcription takes.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.avg_seconds = None
+
+    def _take_slot(self) -> bool:
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        return True
+
+    def try_acquire(self) -> bool:
+        if not self._take_slot():
+            self.rejected += 1
+            return False
+        return True
+
+    async def acquire(self):
+        """Wait for a slot instead of being rejected (used for stream finals)."""
+        while not self._take_slot():
+            await asyncio.sleep(0.05)
+
+    def release(self):
+        """Give back a slot that ended up not being used for run()."""
+        self.pending -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up."""
+        per_job = self.avg_seconds or 1.0
+        return max(1, math.ceil(per_job * self.pending / self.workers))
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool; releases the slot taken by try_acquire()."""
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            elapsed = time.perf_counter() - start
+            self.avg_seconds = elapsed if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * elapsed
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "cpuThreads": CPU_THREADS,
+            "maxPending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avgSeconds": round(self.avg_seconds, 3) if self.avg_seconds is not None else None,
+        }
+
+
+inference = InferenceExecutor(NUM_WORKERS, MAX_PENDING)
+
+
+class TranscriptCache:
+    """
+    Bounded LRU cache of transcription results, keyed by audio content.
+
+    The key hashes the uploaded bytes together with everything that changes
+    the transcript (model, compute type, language, decode and VAD options), so
+    a Bull retry or a re-submitted recording is answered without decoding.
+    Entries are the JSON-encoded result; memory is capped by entry count and
+    bytes with least-recently-used eviction. With a directory configured,
+    entries are also written there as <key>.json and read back on a memory
+    miss; that tier is capped by bytes, evicting the least recently used
+    (oldest mtime) files. Its size is scanned once at startup and then
+    tracked per write; only a write that takes it over the cap rescans the
+    directory, evicting down to DISK_LOW_WATER of the cap so the next scan
+    is many writes away. Writes by other workers sharing the directory are
+    only seen at those rescans.
+    """
+
+    DISK_LOW_WATER = 0.9
+
+    def __init__(self, max_entries: int, max_bytes: int, directory: str = '', disk_max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    @staticmethod
+    def key(audio_hash: str, **options) -> str:
+        described = ";".join(f"{k}={options[k]}" for k in sorted(options))
+        return hashlib.sha256(f"{audio_hash}\0{described}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(data)
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._remember(key, data)
+        return json.loads(data)
+
+    def put(self, key: str, result: dict) -> None:
+        if self.max_entries <= 0:
+            return
+        data = json.dumps(result).encode("utf-8")
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _read_disk(self, key: str):
+        if not self.directory:
+            return None
+        path = self.directory / f"{key}.json"
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mtime tracks recency for disk eviction
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        if not self.directory or len(data) > self.disk_max_bytes:
+            return
+        path = self.directory / f"{key}.json"
+        try:
+            tmp = self.directory / f".{key}.{threading.get_ident()}.tmp"
+            tmp.write_bytes(data)
+            try:
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = 0
+            tmp.replace(path)
+        except OSError as e:
+            print(f"Warning: Could not write transcript cache entry: {e}")
+            return
+        with self._disk_lock:
+            self._disk_bytes += len(data) - replaced
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _disk_files(self) -> list:
+        """(mtime, size, path) of every entry file in the cache directory."""
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict_disk(self) -> None:
+        """Rescan and drop the oldest files down to the low-water mark (holding _disk_lock)."""
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * self.DISK_LOW_WATER
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "disk": str(self.directory) if self.directory else None,
+                "diskBytes": self._disk_bytes if self.directory else None,
+                "diskMaxBytes": self.disk_max_bytes if self.directory else None,
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+transcript_cache = TranscriptCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_DIR, CACHE_DISK_MAX_BYTES)
+
+
+def audio_hash(audio: UploadFile) -> str:
+    """SHA-256 of the uploaded bytes, read from the spooled buffer without copying it whole."""
+    digest = hashlib.sha256()
+    audio.file.seek(0)
+    for chunk in iter(lambda: audio.file.read(1 << 16), b""):
+        digest.update(chunk)
+    audio.file.seek(0)
+    return digest.hexdigest()
+
+
+def transcript_cache_key(audio: UploadFile, tier: str, mode: str, options: dict) -> str:
+    """Cache key for an upload under a tier's model and the decode/VAD settings."""
+    size, compute_type = MODEL_TIERS[tier]
+    return TranscriptCache.key(
+        audio_hash(audio), model=size, compute_type=compute_type, language="en", mode=mode,
+        options=json.dumps(options, sort_keys=True), format=CACHE_FORMAT,
+        vad=VAD_ENABLED and VAD_OPTIONS.threshold, energy_gate=ENERGY_GATE_DBFS,
+    )
+
+
+def current_rss_mb() -> float:
+    """Resident set size right now (Linux), for measuring what a model load costs."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def estimate_model_mb(size: str, compute_type: str) -> float:
+    params = MODEL_PARAMS_M.get(size, MODEL_PARAMS_M["tiny"])
+    return params * BYTES_PER_WEIGHT.get(compute_type, 4) + MODEL_OVERHEAD_MB
+
+
+class LoadedModel:
+    """A loaded tier: the WhisperModel, its batched pipeline and usage bookkeeping."""
+
+    def __init__(self, tier: str, size: str, compute_type: str):
+        self.tier = tier
+        self.size = size
+        self.compute_type = compute_type
+        self.estimate_mb = estimate_model_mb(size, compute_type)
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        self.model = WhisperModel(size, device="cpu", compute_type=compute_type,
+                                  cpu_threads=CPU_THREADS, num_workers=NUM_WORKERS)
+        self.batched = BatchedInferencePipeline(model=self.model)
+        self.load_seconds = round(time.perf_counter() - start, 2)
+        self.measured_mb = round(max(0.0, current_rss_mb() - rss_before), 1)
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class ModelBudgetError(Exception):
+    """A tier cannot be loaded because the models in use already fill the memory budget."""
+
+
+class ModelRegistry:
+    """
+    Lazily loaded Whisper models, one per tier, within a memory budget.
+
+    `use(tier)` loads the tier on first use (one load at a time) and holds a
+    reference while a transcription runs. To make room, idle models are
+    unloaded least recently used first; models in use and the pinned default
+    tier are never unloaded. The budget is enforced on estimated sizes
+    (estimate_model_mb); the RSS actually added by each load is reported too.
+    """
+
+    def __init__(self, tiers: dict, default_tier: str, memory_mb: float, idle_seconds: float):
+        if default_tier not in tiers:
+            raise ValueError(f"Default tier '{default_tier}' is not one of {sorted(tiers)}")
+        self.tiers = tiers
+        self.default_tier = default_tier
+        self.memory_mb = memory_mb
+        self.idle_seconds = idle_seconds
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _take(self, tier: str):
+        entry = self._loaded.get(tier)
+        if entry is not None:
+            entry.refs += 1
+            entry.last_used = time.monotonic()
+            self._loaded.move_to_end(tier)
+        return entry
+
+    @contextmanager
+    def use(self, tier: str):
+        with self._lock:
+            entry = self._take(tier)
+        if entry is None:
+            entry = self._load(tier)
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.refs -= 1
+                entry.last_used = time.monotonic()
+
+    def _load(self, tier: str) -> LoadedModel:
+        size, compute_type = self.tiers[tier]
+        with self._load_lock:
+            with self._lock:
+                entry = self._take(tier)
+                if entry is not None:
+                    return entry
+                self._make_room(estimate_model_mb(size, compute_type))
+            print(f"Loading Whisper {size} ({compute_type}) model for tier '{tier}'...")
+            entry = LoadedModel(tier, size, compute_type)
+            print(f"Tier '{tier}' loaded in {entry.load_seconds}s (+{entry.measured_mb} MB RSS)")
+            with self._lock:
+                entry.refs = 1
+                self._loaded[tier] = entry
+                self.loads += 1
+            return entry
+
+    def _make_room(self, needed_mb: float):
+        """Unload idle models (LRU first) until needed_mb fits; caller holds the lock."""
+        used = sum(e.estimate_mb for e in self._loaded.values())
+        for tier, entry in list(self._loaded.items()):
+            if used + needed_mb <= self.memory_mb:
+                break
+            if entry.refs == 0 and tier != self.default_tier:
+                self._unload(tier)
+                used -= entry.estimate_mb
+        if used + needed_mb > self.memory_mb and self._loaded:
+            raise ModelBudgetError(f"Loading {needed_mb:.0f} MB would exceed the {self.memory_mb:.0f} MB "
+                                   f"model budget ({used:.0f} MB in use)")
+
+    def _unload(self, tier: str):
+        del self._loaded[tier]
+        self.evictions += 1
+        print(f"Unloaded Whisper tier '{tier}'")
+
+    def evict_idle(self):
+        """Unload every non-default model unused for idle_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            for tier, entry in list(self._loaded.items()):
+                if tier != self.default_tier and entry.refs == 0 and now - entry.last_used > self.idle_seconds:
+                    self._unload(tier)
+
+    def preload(self, tier: str):
+        with self.use(tier):
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "defaultTier": self.default_tier,
+                "tiers": {name: f"{size}:{compute_type}" for name, (size, compute_type) in self.tiers.items()},
+                "loaded": {
+                    tier: {"model": entry.size, "computeType": entry.compute_type, "inUse": entry.refs,
+                           "estimatedMb": entry.estimate_mb, "measuredMb": entry.measured_mb,
+                           "loadSeconds": entry.load_seconds,
+                           "idleSeconds": round(time.monotonic() - entry.last_used, 1)}
+                    for tier, entry in self._loaded.items()
+                },
+                "memoryBudgetMb": self.memory_mb,
+                "estimatedMb": sum(e.estimate_mb for e in self._loaded.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+models = ModelRegistry(MODEL_TIERS, DEFAULT_TIER, MODEL_MEMORY_MB, MODEL_IDLE_SECONDS)
+
+
+def load_waveform(audio: UploadFile):
+    """Decode an upload straight from its spooled buffer to a 16 kHz mono float32 waveform."""
+    audio.file.seek(0)
+    waveform = decode_audio(audio.file, sampling_rate=SAMPLE_RATE)
+    request_bytes = memory_stats.record(audio.size or 0, len(waveform))
+    return waveform, request_bytes
+
+
+def peak_dbfs(waveform) -> float:
+    """Loudness of the loudest 20 ms frame (RMS, dB relative to full scale)."""
+    frames = len(waveform) // ENERGY_FRAME_SAMPLES
+    if frames == 0:
+        rms = float(np.sqrt(np.mean(np.square(waveform)))) if len(waveform) else 0.0
+    else:
+        framed = waveform[:frames * ENERGY_FRAME_SAMPLES].reshape(frames, ENERGY_FRAME_SAMPLES)
+        rms = float(np.sqrt(np.square(framed).mean(axis=1).max()))
+    return 20 * math.log10(rms) if rms > 0 else float('-inf')
+
+
+def find_speech(waveform) -> dict:
+    """
+    Locate speech before any decoding: {start, end, speechSeconds, reason}.
+
+    `start`/`end` (samples) bound the span worth transcribing; `reason` is
+    "energy" or "vad" when the clip holds no speech at all, otherwise None.
+    """
+    if peak_dbfs(waveform) < ENERGY_GATE_DBFS:
+        return {"start": 0, "end": 0, "speechSeconds": 0.0, "reason": "energy"}
+    if not VAD_ENABLED:
+        return {"start": 0, "end": len(waveform), "speechSeconds": len(waveform) / SAMPLE_RATE, "reason": None}
+
+    regions = get_speech_timestamps(waveform, VAD_OPTIONS, sampling_rate=SAMPLE_RATE)
+    if not regions:
+        return {"start": 0, "end": 0, "speechSeconds": 0.0, "reason": "vad"}
+    speech_samples = sum(r["end"] - r["start"] for r in regions)
+    return {"start": regions[0]["start"], "end": regions[-1]["end"],
+            "speechSeconds": round(speech_samples / SAMPLE_RATE, 3), "reason": None}
+
+
+def no_speech_result(total_seconds: float, reason: str) -> dict:
+    return {
+        "text": "",
+        "language": "en",
+        "duration": total_seconds,
+        "noSpeech": True,
+        "reason": reason,
+        "speechSeconds": 0.0,
+        "totalSeconds": total_seconds,
+        **transcript_confidence([])
+    }
+
+
+async def evict_idle_models():
+    while True:
+        await asyncio.sleep(min(60.0, models.idle_seconds))
+        models.evict_idle()
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Load the Whisper model on startup"""
-    global model
-    print("Loading Whisper tiny model...")
-    # Using 'tiny' model instead of 'base' to prevent Out Of Memory crashes on Free Tier
-    model = WhisperModel("tiny", device="cpu", compute_type="int8")
+    """Load the default-tier Whisper model on startup"""
+    models.preload(DEFAULT_TIER)
     print("Whisper model loaded successfully!")
+    asyncio.create_task(evict_idle_models())
+
+
+def model_budget_exceeded(error: ModelBudgetError) -> HTTPException:
+    print(f"Tier unavailable: {error}")
+    return HTTPException(
+        status_code=503,
+        detail={"error": "Model tier unavailable", "details": str(error)},
+        headers={"Retry-After": str(inference.retry_after())}
+    )
+
+
+def resolve_profile(profile) -> str:
+    """The requested decode profile, or the default; unknown names are a 400."""
+    if not profile:
+        return DEFAULT_PROFILE
+    if profile not in DECODE_PROFILES:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown profile '{profile}' (available: {', '.join(DECODE_PROFILES)})")
+    return profile
+
+
+# normalize()/tokenize() follow sbert-service/app.py, so the prompted words are
+# the tokens the grader later compares the transcript against.
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text)
+    return _WHITESPACE_RE.sub(" ", text.strip().lower())
+
+
+def tokenize(text: str) -> list[str]:
+    """Return meaningful word tokens (no punctuation, no single chars)."""
+    return [t for t in _TOKEN_RE.findall(normalize(text)) if len(t) > 1 or t.isdigit()]
+
+
+def content_words(text, seen: set) -> list[str]:
+    """Distinct tokens of `text` that are worth prompting, skipping those in `seen`."""
+    words = []
+    for token in tokenize(text or ""):
+        if (len(token) > 2 or token.isdigit()) and token not in PROMPT_STOPWORDS and token not in seen:
+            seen.add(token)
+            words.append(token)
+    return words
+
+
+def vocabulary_options(question_text=None, correct_answer=None) -> dict:
+    """
+    initial_prompt / hotwords for a question, so domain terms decode as words.
+
+    The question's content words become the initial prompt (context for the
+    first window, which is the whole clip for a short answer); the expected
+    answer's content words become hotwords, which are prompted on every
+    window. Only distinct words are passed, never the answer sentence.
+    """
+    seen = set()
+    answer_words = content_words(correct_answer, seen)[:PROMPT_MAX_WORDS]
+    question_words = content_words(question_text, seen)[:PROMPT_MAX_WORDS - len(answer_words)]
+    options = {}
+    if question_words:
+        options["initial_prompt"] = ", ".join(question_words)
+    if answer_words:
+        options["hotwords"] = ", ".join(answer_words)
+    return options
+
+
+def decode_options(profile: str, question_text=None, correct_answer=None) -> dict:
+    """faster-whisper transcribe() keyword arguments for a profile and question."""
+    return {**DECODE_PROFILES[profile], **vocabulary_options(question_text, correct_answer)}
+
+
+def transcript_confidence(scores) -> dict:
+    """
+    Confidence of a transcript from its segments' (tokens, avg_logprob,
+    no_speech_prob): the token-weighted mean log probability, the highest
+    no-speech probability and whether either crosses its threshold.
+    """
+    tokens = sum(n for n, _, _ in scores)
+    if not tokens:
+        return {"avgLogprob": None, "noSpeechProb": None, "lowConfidence": True}
+    avg_logprob = sum(n * logprob for n, logprob, _ in scores) / tokens
+    no_speech_prob = max(p for _, _, p in scores)
+    return {
+        "avgLogprob": round(avg_logprob, 4),
+        "noSpeechProb": round(no_speech_prob, 4),
+        "lowConfidence": avg_logprob < LOW_CONFIDENCE_LOGPROB or no_speech_prob > LOW_CONFIDENCE_NO_SPEECH,
+    }
+
+
+def segment_scores(segment) -> tuple:
+    return len(segment.tokens), segment.avg_logprob, segment.no_speech_prob
+
+
+def resolve_tier(tier) -> str:
+    """The requested tier, or the default; unknown names are a 400."""
+    if not tier:
+        return DEFAULT_TIER
+    if tier not in MODEL_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown tier '{tier}' (available: {', '.join(MODEL_TIERS)})")
+    return tier
 
 
 @app.get('/health')
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "whisper-transcription"}
+    return {"status": "healthy", "service": "whisper-transcription",
+            "memory": memory_stats.stats(), "inference": inference.stats(),
+            "transcriptCache": transcript_cache.stats(), "models": models.stats()}
+
+
+def transcribe_upload(audio: UploadFile, tier: str, profile: str, question_text=None, correct_answer=None) -> dict:
+    """Blocking part of /transcribe: decode and run Whisper (called on the inference pool)."""
+    options = decode_options(profile, question_text, correct_answer)
+    cache_key = transcript_cache_key(audio, tier, "single", options)
+    cached = transcript_cache.get(cache_key)
+    if cached is not None:
+        print(f"Transcript cache hit for {audio.filename}")
+        return {**cached, "cached": True}
+    
+    # Decode in memory — nothing is written under the client filename
+    waveform, request_bytes = load_waveform(audio)
+    
+    total_seconds = len(waveform) / SAMPLE_RATE
+    speech = find_speech(waveform)
+    if speech["reason"]:
+        print(f"No speech in {audio.filename} ({speech['reason']}), skipping decode")
+        result = no_speech_result(total_seconds, speech["reason"])
+        transcript_cache.put(cache_key, result)
+        return {**result, "cached": False}
+    
+    print(f"Transcribing file: {audio.filename} ({audio.size} bytes, ~{request_bytes} bytes held, "
+          f"{speech['speechSeconds']}s speech of {total_seconds:.1f}s)")
+    
+    with models.use(tier) as whisper:
+        result = transcribe_waveform(whisper, waveform[speech["start"]:speech["end"]], options)
+    result.update(duration=total_seconds, noSpeech=False, tier=tier, profile=profile,
+                  speechSeconds=speech["speechSeconds"], totalSeconds=total_seconds)
+    
+    print(f"Transcription completed: {result['text'][:100]}... (avg logprob {result['avgLogprob']})")
+    
+    transcript_cache.put(cache_key, result)
+    return {**result, "cached": False}
+
+
+def transcribe_waveform(whisper: LoadedModel, waveform, options: dict | None = None) -> dict:
+    # The segment generator does the decoding, so it is consumed here too
+    segments, info = whisper.model.transcribe(waveform, language="en", **(options or {}))
+    segments = list(segments)
+    transcription = " ".join([segment.text for segment in segments])
+    return {
+        "text": transcription.strip(),
+        "language": info.language,
+        "duration": info.duration,
+        **transcript_confidence([segment_scores(segment) for segment in segments])
+    }
+
+
+def transcribe_clips(whisper: LoadedModel, waveforms: list, options: dict | None = None) -> list[dict]:
+    """
+    Transcribe many short clips with padded batches instead of one call each.
+
+    The clips are laid end to end and handed to BatchedInferencePipeline with
+    one clip timestamp per clip, so each clip becomes one 30 s encoder slot
+    and BATCH_SIZE slots share each encoder/decoder pass. Batched decoding
+    runs the profile's beam search (faster-whisper's beam_size=5 under
+    "default") at the first temperature only, with no temperature fallback,
+    no timestamps and no conditioning on earlier text. Clips over 30 s do not
+    fit a slot and go through transcribe_waveform() individually.
+    """
+    results = [None] * len(waveforms)
+    short = []
+    for i, waveform in enumerate(waveforms):
+        if len(waveform) / SAMPLE_RATE > MAX_BATCH_CLIP_SECONDS:
+            results[i] = transcribe_waveform(whisper, waveform, options)
+        elif len(waveform):
+            short.append(i)
+        else:
+            results[i] = {"text": "", "language": "en", "duration": 0.0, **transcript_confidence([])}
+
+    if short:
+        offsets, clip_timestamps, position = [], [], 0
+        for i in short:
+            offsets.append(position / SAMPLE_RATE)
+            clip_timestamps.append({"start": position / SAMPLE_RATE,
+                                    "end": (position + len(waveforms[i])) / SAMPLE_RATE})
+            position += len(waveforms[i])
+        audio = np.concatenate([waveforms[i] for i in short])
+
+        batch_options = {k: v for k, v in (options or {}).items() if k != "condition_on_previous_text"}
+        segments, info = whisper.batched.transcribe(audio, language="en", batch_size=BATCH_SIZE,
+                                                  clip_timestamps=clip_timestamps, **batch_options)
+        texts = [[] for _ in short]
+        scores = [[] for _ in short]
+        for segment in segments:
+            # Segment times are absolute in the concatenated audio (rounded to 1 ms)
+            slot = bisect.bisect_right(offsets, segment.start + 0.001) - 1
+            texts[slot].append(segment.text)
+            scores[slot].append(segment_scores(segment))
+
+        for slot, i in enumerate(short):
+            results[i] = {
+                "text": " ".join(texts[slot]).strip(),
+                "language": info.language,
+                "duration": len(waveforms[i]) / SAMPLE_RATE,
+                **transcript_confidence(scores[slot])
+            }
+    return results
+
+
+def transcribe_batch_uploads(clips: list[UploadFile], tier: str, profile: str) -> dict:
+    """Blocking part of /transcribe-batch: decode and VAD every clip, then run one batched pass."""
+    start = time.perf_counter()
+    # Clips share one batched decode, so there is no per-question prompt here
+    options = decode_options(profile)
+    waveforms, entries, speech_entries, cache_keys = [], [], [], []
+    for index, clip in enumerate(clips):
+        clip_start = time.perf_counter()
+        cache_key = transcript_cache_key(clip, tier, "batched", options)
+        cached = transcript_cache.get(cache_key)
+        if cached is not None:
+            entries.append({"index": index, "filename": clip.filename, **cached, "cached": True})
+            continue
+        try:
+            waveform, _ = load_waveform(clip)
+        except Exception as e:
+            entries.append({"index": index, "filename": clip.filename,
+                            "error": "Could not decode audio", "details": str(e)})
+            continue
+        decode_done = time.perf_counter()
+        speech = find_speech(waveform)
+        entry = {"index": index, "filename": clip.filename,
+                 "timings": {"decodeMs": round((decode_done - clip_start) * 1000, 2),
+                             "vadMs": round((time.perf_counter() - decode_done) * 1000, 2)}}
+        entries.append(entry)
+        total_seconds = len(waveform) / SAMPLE_RATE
+        if speech["reason"]:
+            result = no_speech_result(total_seconds, speech["reason"])
+            transcript_cache.put(cache_key, result)
+            entry.update(result, cached=False)
+            continue
+        waveforms.append(waveform[speech["start"]:speech["end"]])
+        entry.update(noSpeech=False, speechSeconds=speech["speechSeconds"], totalSeconds=total_seconds,
+                     tier=tier, profile=profile)
+        speech_entries.append(entry)
+        cache_keys.append(cache_key)
+    decode_ms = (time.perf_counter() - start) * 1000
+
+    cached = sum(1 for entry in entries if entry.get("cached"))
+    undecodable = sum(1 for entry in entries if "error" in entry)
+    print(f"Batch-transcribing {len(waveforms)} clips ({cached} cached, "
+          f"{len(entries) - len(waveforms) - cached - undecodable} without speech, {undecodable} undecodable)")
+    inference_start = time.perf_counter()
+    results = []
+    if waveforms:
+        with models.use(tier) as whisper:
+            results = transcribe_clips(whisper, waveforms, options)
+    inference_ms = (time.perf_counter() - inference_start) * 1000
+
+    for entry, result, cache_key in zip(speech_entries, results, cache_keys):
+        entry.update(result, duration=entry["totalSeconds"])
+        transcript_cache.put(cache_key, {k: v for k, v in entry.items()
+                                         if k not in ("index", "filename", "timings")})
+        entry["cached"] = False
+
+    return {
+        "results": entries,
+        "timings": {
+            "decodeMs": round(decode_ms, 2),
+            "inferenceMs": round(inference_ms, 2),
+            "totalMs": round((time.perf_counter() - start) * 1000, 2),
+        },
+        "clips": len(clips),
+        "batchSize": BATCH_SIZE
+    }
+
+
+def transcribe_window(tier: str, waveform, prompt: str) -> list[dict]:
+    """Greedy pass over a stream window; segment times are relative to the window."""
+    with models.use(tier) as whisper:
+        segments, _ = whisper.model.transcribe(waveform, language="en", beam_size=1,
+                                               condition_on_previous_text=False, initial_prompt=prompt or None)
+        segments = list(segments)
+    return [{"start": seg.start, "end": seg.end, "text": seg.text.strip(), "scores": segment_scores(seg)}
+            for seg in segments]
+
+
+class StreamLimitError(Exception):
+    """A stream has grown past STREAM_MAX_SECONDS or STREAM_MAX_BYTES."""
+
+
+class StreamSession:
+    """
+    Audio and transcript state of one /transcribe-stream connection.
+
+    Audio arrives either as raw 16-bit little-endian mono PCM at `sample_rate`
+    ("pcm16"), or as a growing container stream (webm/ogg opus from
+    MediaRecorder), which is re-decoded from the start on each snapshot.
+    Everything before `offset` (samples at 16 kHz) is committed text and is
+    never transcribed again. add_audio() enforces the stream limits.
+    """
+
+    def __init__(self, tier: str, audio_format: str = "pcm16", sample_rate: int = SAMPLE_RATE):
+        self.tier = tier
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.buffer = bytearray()
+        self.offset = 0
+        self.committed = []
+        self.committed_scores = []
+        self.tentative = ""
+        self.transcribed_samples = 0
+        self._decoded = None  # (buffer length, waveform) of the last container decode
+        self.decode_seconds = 0.0  # wall time of the last container decode
+
+    def add_audio(self, chunk: bytes):
+        """
+        Append a chunk, raising StreamLimitError past the stream limits.
+
+        Container lengths are only known once decoded, so their seconds limit
+        applies to the last snapshot; the byte limit bounds them in between.
+        """
+        if len(self.buffer) + len(chunk) > STREAM_MAX_BYTES:
+            raise StreamLimitError(f"Stream exceeds {STREAM_MAX_BYTES} bytes")
+        self.buffer.extend(chunk)
+        if self.buffered_seconds() > STREAM_MAX_SECONDS:
+            raise StreamLimitError(f"Stream exceeds {STREAM_MAX_SECONDS:g} s of audio")
+
+    async def waveform(self):
+        """
+        The whole stream so far, as 16 kHz mono float32.
+
+        Container decodes run on a worker thread (they grow with the stream)
+        and are reused until more audio arrives.
+        """
+        if self.audio_format != "pcm16":
+            size = len(self.buffer)
+            if self._decoded is None or self._decoded[0] != size:
+                data = io.BytesIO(bytes(self.buffer))
+                start = time.perf_counter()
+                self._decoded = (size, await asyncio.to_thread(decode_audio, data, sampling_rate=SAMPLE_RATE))
+                self.decode_seconds = time.perf_counter() - start
+            return self._decoded[1]
+        pcm = np.frombuffer(self.buffer[:len(self.buffer) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
+        if self.sample_rate != SAMPLE_RATE and len(pcm):
+            target = np.arange(int(len(pcm) * SAMPLE_RATE / self.sample_rate)) * self.sample_rate / SAMPLE_RATE
+            pcm = np.interp(target, np.arange(len(pcm)), pcm).astype(np.float32)
+        return pcm
+
+    def buffered_seconds(self) -> float:
+        """Stream length without decoding (exact for PCM, 0 until the first snapshot otherwise)."""
+        if self.audio_format == "pcm16":
+            return len(self.buffer) / 2 / self.sample_rate
+        return self.transcribed_samples / SAMPLE_RATE
+
+    def prompt(self) -> str:
+        return " ".join(self.committed)[-200:]
+
+    def advance(self, segments: list[dict], window_seconds: float, final: bool):
+        """Commit the segments that can no longer change and keep the rest tentative."""
+        if final:
+            done = segments
+        else:
+            cutoff = window_seconds - STREAM_COMMIT_MARGIN
+            done = [seg for seg in segments[:-1] if seg["end"] <= cutoff]
+            if not done and window_seconds > STREAM_WINDOW_SECONDS:
+                done = segments[:-1] or segments
+        if done:
+            self.committed.extend(seg["text"] for seg in done if seg["text"])
+            self.committed_scores.extend(seg["scores"] for seg in done)
+            self.offset += int(done[-1]["end"] * SAMPLE_RATE)
+        self.tentative = " ".join(seg["text"] for seg in segments[len(done):] if seg["text"])
+
+    def text(self) -> str:
+        return " ".join(self.committed + ([self.tentative] if self.tentative else []))
+
+
+async def stream_pass(session: StreamSession, final: bool, waveform=None):
+    """
+    Transcribe the uncommitted window on the inference pool and advance the session.
+
+    The caller has already taken an inference slot; it is given back on every
+    path, including a stream that fails to decode.
+    """
+    try:
+        if waveform is None:
+            waveform = await session.waveform()
+        session.transcribed_samples = len(waveform)
+        window = waveform[session.offset:]
+    except BaseException:
+        inference.release()
+        raise
+    segments = []
+    if len(window):
+        segments = await inference.run(transcribe_window, session.tier, window, session.prompt())
+    else:
+        inference.release()
+    session.advance(segments, len(window) / SAMPLE_RATE, final)
+    return waveform
+
+
+def is_end_message(text) -> bool:
+    """The client's end-of-audio marker: "end" or {"type": "end"}."""
+    if not text:
+        return False
+    if text.strip() == "end":
+        return True
+    try:
+        return json.loads(text).get("type") == "end"
+    except (ValueError, AttributeError):
+        return False
+
+
+@app.websocket('/transcribe-stream')
+async def transcribe_stream(websocket: WebSocket, format: str = "pcm16", sample_rate: int = SAMPLE_RATE,
+                            tier: str = ""):
+    """
+    Incremental transcription over a WebSocket.
+
+    Send audio as binary messages (?format=pcm16&sample_rate=16000 for raw
+    s16le mono, or ?format=webm for MediaRecorder chunks; &tier= picks the
+    model tier), then the text
+    message "end". The server pushes {type: "partial", text, committed,
+    tentative, audioSeconds} while audio arrives and one {type: "final", text,
+    language, duration, noSpeech, avgLogprob, noSpeechProb, lowConfidence,
+    finalizeMs} after "end"; finalizeMs is the
+    time from "end" to the final transcript. A stream past
+    STREAM_MAX_SECONDS or STREAM_MAX_BYTES gets an error and close code 1009.
+    """
+    await websocket.accept()
+    if tier and tier not in MODEL_TIERS:
+        await websocket.send_json({"type": "error", "error": f"Unknown tier '{tier}'"})
+        await websocket.close(code=1008)
+        return
+    session = StreamSession(tier or DEFAULT_TIER, format, sample_rate)
+    partial_task = None
+    last_pass_seconds = 0.0
+    last_pass_time = time.perf_counter()
+
+    async def partial():
+        try:
+            await stream_pass(session, final=False)
+        except Exception as e:
+            # The final pass decodes again and reports the error to the client
+            print(f"Partial stream pass failed: {str(e)}")
+            return
+        await websocket.send_json({"type": "partial", "text": session.text(),
+                                   "committed": " ".join(session.committed), "tentative": session.tentative,
+                                   "audioSeconds": round(session.transcribed_samples / SAMPLE_RATE, 2)})
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                try:
+                    session.add_audio(message["bytes"])
+                except StreamLimitError as e:
+                    print(f"Closing stream: {str(e)}")
+                    if partial_task is not None:
+                        await asyncio.gather(partial_task, return_exceptions=True)
+                    await websocket.send_json({"type": "error", "error": "Stream too long", "details": str(e)})
+                    await websocket.close(code=1009)
+                    return
+            elif is_end_message(message.get("text")):
+                break
+
+            # One partial pass at a time; skipped (not queued) when the pool is full.
+            # PCM is paced by audio received, containers (not decoded here) by wall time,
+            # further apart as their full re-decode grows.
+            if session.audio_format == "pcm16":
+                due = session.buffered_seconds() - last_pass_seconds >= STREAM_STEP_SECONDS
+            else:
+                interval = max(STREAM_STEP_SECONDS, session.decode_seconds / STREAM_DECODE_SHARE)
+                due = time.perf_counter() - last_pass_time >= interval
+            if due and (partial_task is None or partial_task.done()) and inference.try_acquire():
+                last_pass_seconds = session.buffered_seconds()
+                last_pass_time = time.perf_counter()
+                partial_task = asyncio.create_task(partial())
+
+        end_time = time.perf_counter()
+        if partial_task is not None:
+            await asyncio.gather(partial_task, return_exceptions=True)
+
+        waveform = await session.waveform()
+        total_seconds = len(waveform) / SAMPLE_RATE
+        speech = find_speech(waveform) if not session.committed else {"reason": None}
+        if speech["reason"]:
+            result = {"type": "final", **no_speech_result(total_seconds, speech["reason"])}
+        else:
+            await inference.acquire()
+            await stream_pass(session, final=True, waveform=waveform)
+            result = {"type": "final", "text": session.text(), "language": "en", "duration": total_seconds,
+                      "noSpeech": False, **transcript_confidence(session.committed_scores)}
+        result["finalizeMs"] = round((time.perf_counter() - end_time) * 1000, 2)
+        print(f"Stream finished: {total_seconds:.1f}s audio, final after {result['finalizeMs']}ms")
+        await websocket.send_json(result)
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        print("Stream client disconnected")
+    except Exception as e:
+        print(f"Error during stream transcription: {str(e)}")
+        await websocket.send_json({"type": "error", "error": "Transcription failed", "details": str(e)})
+        await websocket.close(code=1011)
 
 
 @app.post('/transcribe')
-async def transcribe(audio: UploadFile = File(...)):
-    """Transcribe audio file"""
+async def transcribe(audio: UploadFile = File(...), tier: str = Form(None), profile: str = Form(None),
+                     questionText: str = Form(None), correctAnswer: str = Form(None)):
+    """
+    Transcribe audio file with the model of `tier` and the decode `profile`
+    (defaults if omitted). Optional `questionText` / `correctAnswer` prime
+    the decoder with the question's vocabulary (see vocabulary_options).
+
+    Returns { text, language, duration, noSpeech, speechSeconds, totalSeconds, tier, profile,
+    avgLogprob, noSpeechProb, lowConfidence, cached };
+    clips without speech are not transcribed and come back with
+    noSpeech: true, an empty text and a `reason` ("energy" or "vad").
+    """
     if not audio:
         raise HTTPException(status_code=400, detail="No audio file provided")
     
     if audio.filename == '':
         raise HTTPException(status_code=400, detail="No file selected")
     
-    # Save the uploaded file temporarily
-    filename = audio.filename
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    tier = resolve_tier(tier)
+    profile = resolve_profile(profile)
+    
+    if not inference.try_acquire():
+        raise HTTPException(
+            status_code=429,
+            detail={"error": "Transcription queue full", "details": f"{inference.pending} requests pending"},
+            headers={"Retry-After": str(inference.retry_after())}
+        )
     
     try:
-        # Save uploaded file
-        with open(filepath, 'wb') as buffer:
-            shutil.copyfileobj(audio.file, buffer)
-        
-        print(f"Transcribing file: {filename}")
+        return await inference.run(transcribe_upload, audio, tier, profile, questionText, correctAnswer)
         
-        # Perform transcription
-        segments, info = model.transcribe(filepath, language="en")
-        transcription = " ".join([segment.text for segment in segments])
-        
-        # Clean up the temporary file
-        try:
-            os.remove(filepath)
-        except Exception as e:
-            print(f"Warning: Could not delete temporary file: {e}")
-        
-        print(f"Transcription completed: {transcription[:100]}...")
+    except ModelBudgetError as e:
+        raise model_budget_exceeded(e)
+    except Exception as e:
+        print(f"Error during transcription: {str(e)}")
         
-        return {
-            "text": transcription.strip(),
-            "language": info.language,
-            "duration": info.duration
-        }
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "Transcription failed",
+                "details": str(e)
+            }
+        )
+
+
+@app.post('/transcribe-batch')
+async def transcribe_batch(audio: list[UploadFile] = File(...), tier: str = Form(None),
+                           profile: str = Form(None)):
+    """
+    Transcribe several clips (repeat the `audio` field) in one padded batch.
+    Results keep the upload order; a clip that cannot be decoded gets an
+    `error` entry without failing the others, and a clip without speech a
+    `noSpeech` entry without being transcribed.
+
+    The batched decode has no temperature fallback and no timestamps (see
+    transcribe_clips), so under the "default" profile a clip can come back
+    with different text than /transcribe gives it; "fast" already decodes
+    that way on both endpoints.
+    """
+    if len(audio) > BATCH_MAX_CLIPS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_CLIPS} clips per batch")
+    
+    tier = resolve_tier(tier)
+    profile = resolve_profile(profile)
+    
+    if not inference.try_acquire():
+        raise HTTPException(
+            status_code=429,
+            detail={"error": "Transcription queue full", "details": f"{inference.pending} requests pending"},
+            headers={"Retry-After": str(inference.retry_after())}
+        )
+    
+    try:
+        return await inference.run(transcribe_batch_uploads, audio, tier, profile)
         
+    except ModelBudgetError as e:
+        raise model_budget_exceeded(e)
     except Exception as e:
-        print(f"Error during transcription: {str(e)}")
-        # Clean up file if it exists
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except:
-            pass
+        print(f"Error during batch transcription: {str(e)}")
         
         raise HTTPException(
             status_code=500,
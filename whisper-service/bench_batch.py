@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Sequential /transcribe vs batched /transcribe-batch, in-process.
+
+For each batch size N, transcribes the same N clips once per clip (what the
+backend does today) and once through transcribe_clips(), and reports the
+wall time of both and the smallest N where batching wins (the crossover).
+
+  python bench_batch.py                       # synthetic 3-20 s clips
+  python bench_batch.py --clips ./answers     # a directory of real recordings
+  python bench_batch.py --sizes 1,2,4,8,16 --json bench_batch.json
+
+Synthetic clips are tone bursts, so the transcripts are meaningless; only the
+timings are of interest.
+
+Both sides decode with the same options: the --profile options plus what the
+batched pipeline forces anyway (first temperature only, no timestamps, no
+conditioning), so the speedup measures batching and not a cheaper decode.
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from faster_whisper import decode_audio
+
+import app
+
+# Settings BatchedInferencePipeline always uses, applied to the sequential side too
+BATCHED_DECODE = {"temperature": 0.0, "without_timestamps": True, "condition_on_previous_text": False}
+
+
+def synthetic_clips(count: int, seed: int = 0) -> list:
+    """Tone bursts of 3-20 s with a little noise, at 16 kHz."""
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(count):
+        seconds = rng.uniform(3, 20)
+        t = np.arange(int(seconds * app.SAMPLE_RATE)) / app.SAMPLE_RATE
+        bursts = np.sin(2 * np.pi * rng.uniform(1, 3) * t) > 0
+        clip = 0.3 * np.sin(2 * np.pi * rng.uniform(120, 300) * t) * bursts
+        clips.append((clip + 0.003 * rng.standard_normal(len(t))).astype(np.float32))
+    return clips
+
+
+def load_clips(directory: str) -> list:
+    paths = sorted(p for p in Path(directory).iterdir() if p.is_file())
+    return [decode_audio(str(p), sampling_rate=app.SAMPLE_RATE) for p in paths]
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="tiny", help="model size or path (default: tiny)")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--clips", help="directory of audio files (default: synthetic clips)")
+    parser.add_argument("--sizes", default="1,2,4,8,16", help="comma-separated batch sizes")
+    parser.add_argument("--profile", default="fast", choices=list(app.DECODE_PROFILES),
+                        help="decode profile for both sides (default: fast)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    clips = load_clips(args.clips) if args.clips else synthetic_clips(max(sizes))
+    if len(clips) < max(sizes):
+        clips = (clips * (max(sizes) // len(clips) + 1))[:max(sizes)]
+
+    options = {**app.DECODE_PROFILES[args.profile], **BATCHED_DECODE}
+    whisper = app.LoadedModel("bench", args.model, args.compute_type)
+    app.transcribe_clips(whisper, clips[:1], options)  # warm-up
+
+    print(f"model={args.model}  compute_type={args.compute_type}  batch_size={app.BATCH_SIZE}  "
+          f"cpu_threads={app.CPU_THREADS or 'default'}")
+    print(f"decode options ({args.profile}, both sides): {options}\n")
+    print(f"  {'N':>3}  {'audio s':>8}  {'sequential s':>12}  {'batched s':>9}  {'speedup':>7}")
+    print(f"  {'-'*3}  {'-'*8}  {'-'*12}  {'-'*9}  {'-'*7}")
+
+    rows = []
+    for n in sizes:
+        batch = clips[:n]
+        sequential = sum(timed(app.transcribe_waveform, whisper, clip, options) for clip in batch)
+        batched = timed(app.transcribe_clips, whisper, batch, options)
+        audio_seconds = sum(len(c) for c in batch) / app.SAMPLE_RATE
+        rows.append({
+            "clips": n,
+            "audio_seconds": round(audio_seconds, 2),
+            "sequential_seconds": round(sequential, 3),
+            "batched_seconds": round(batched, 3),
+            "speedup": round(sequential / batched, 2),
+        })
+        print(f"  {n:>3}  {audio_seconds:>8.1f}  {sequential:>12.2f}  {batched:>9.2f}  {sequential / batched:>6.2f}x")
+
+    crossover = next((r["clips"] for r in rows if r["speedup"] > 1.0), None)
+    print(f"\nCrossover: batching wins from N={crossover}" if crossover else "\nBatching never won")
+
+    if args.json:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "model": args.model,
+            "compute_type": args.compute_type,
+            "batch_size": app.BATCH_SIZE,
+            "cpu_threads": app.CPU_THREADS,
+            "cpu_count": os.cpu_count(),
+            "profile": args.profile,
+            "decode_options": options,
+            "clip_source": args.clips or "synthetic",
+            "results": rows,
+            "crossover_clips": crossover,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"JSON report: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
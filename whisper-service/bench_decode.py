@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Decode-profile benchmark: word error rate and real-time factor per profile.
+
+Runs every clip of a local corpus through the same path as /transcribe
+(energy gate + VAD trim, then WhisperModel.transcribe with the profile's
+options) and compares the profiles on accuracy and speed.
+
+Corpus layout: audio files with a same-stem .txt reference transcript and,
+optionally, same-stem .question.txt / .answer.txt files holding the question
+and its expected answer (passed as questionText / correctAnswer):
+
+  answers/
+    q1_alice.webm   q1_alice.txt   q1_alice.question.txt   q1_alice.answer.txt
+    q2_bob.wav      q2_bob.txt
+
+  python bench_decode.py --corpus ./answers
+  python bench_decode.py --corpus ./answers --tier accurate --json bench_decode.json
+
+RTF = processing seconds / audio seconds (below 1 is faster than real time).
+"""
+
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+
+import app
+
+AUDIO_SUFFIXES = {".wav", ".webm", ".ogg", ".opus", ".mp3", ".m4a", ".flac"}
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_words(text: str) -> list[str]:
+    """Lower-case words without punctuation, the usual WER normalization."""
+    return _WORD_RE.findall(text.lower())
+
+
+def word_edits(reference: list[str], hypothesis: list[str]) -> int:
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def wer(reference: str, hypothesis: str) -> float:
+    ref = normalize_words(reference)
+    return word_edits(ref, normalize_words(hypothesis)) / max(1, len(ref))
+
+
+def read_sidecar(path: Path, suffix: str):
+    sidecar = path.with_suffix(suffix)
+    return sidecar.read_text(encoding="utf-8").strip() if sidecar.exists() else None
+
+
+def load_corpus(directory: str) -> list[dict]:
+    """[{name, waveform, reference, question, answer}] for every audio file with a .txt reference."""
+    corpus = []
+    for path in sorted(Path(directory).iterdir()):
+        reference = path.with_suffix(".txt")
+        if path.suffix.lower() not in AUDIO_SUFFIXES or not reference.exists():
+            continue
+        corpus.append({
+            "name": path.name,
+            "waveform": app.decode_audio(str(path), sampling_rate=app.SAMPLE_RATE),
+            "reference": reference.read_text(encoding="utf-8").strip(),
+            "question": read_sidecar(path, ".question.txt"),
+            "answer": read_sidecar(path, ".answer.txt"),
+        })
+    return corpus
+
+
+def transcribe_like_service(whisper, waveform, options: dict) -> str:
+    """What /transcribe would return as text, minus upload handling and caching."""
+    speech = app.find_speech(waveform)
+    if speech["reason"]:
+        return ""
+    return app.transcribe_waveform(whisper, waveform[speech["start"]:speech["end"]], options)["text"]
+
+
+def run_profile(whisper, corpus: list[dict], profile: str) -> dict:
+    per_clip, edits, ref_words, elapsed_total, audio_total = [], 0, 0, 0.0, 0.0
+    for clip in corpus:
+        options = app.decode_options(profile, clip["question"], clip["answer"])
+        start = time.perf_counter()
+        text = transcribe_like_service(whisper, clip["waveform"], options)
+        elapsed = time.perf_counter() - start
+        audio_seconds = len(clip["waveform"]) / app.SAMPLE_RATE
+
+        ref = normalize_words(clip["reference"])
+        clip_edits = word_edits(ref, normalize_words(text))
+        edits += clip_edits
+        ref_words += len(ref)
+        elapsed_total += elapsed
+        audio_total += audio_seconds
+        per_clip.append({
+            "clip": clip["name"],
+            "audio_seconds": round(audio_seconds, 2),
+            "latency_ms": round(elapsed * 1000, 1),
+            "rtf": round(elapsed / audio_seconds, 4) if audio_seconds else None,
+            "wer": round(clip_edits / max(1, len(ref)), 4),
+            "text": text,
+        })
+
+    latencies = [c["latency_ms"] for c in per_clip]
+    return {
+        "profile": profile,
+        "options": app.decode_options(profile),
+        "wer": round(edits / max(1, ref_words), 4),
+        "mean_clip_wer": round(statistics.mean(c["wer"] for c in per_clip), 4),
+        "rtf": round(elapsed_total / audio_total, 4) if audio_total else None,
+        "avg_latency_ms": round(statistics.mean(latencies), 1),
+        "p50_latency_ms": round(statistics.median(latencies), 1),
+        "per_clip": per_clip,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", required=True, help="directory of audio + .txt reference pairs")
+    parser.add_argument("--tier", default=app.DEFAULT_TIER, choices=sorted(app.MODEL_TIERS))
+    parser.add_argument("--profiles", default=",".join(app.DECODE_PROFILES),
+                        help="comma-separated profiles (default: all)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        parser.error(f"no audio files with .txt references in {args.corpus}")
+    audio_seconds = sum(len(c["waveform"]) for c in corpus) / app.SAMPLE_RATE
+
+    size, compute_type = app.MODEL_TIERS[args.tier]
+    whisper = app.LoadedModel(args.tier, size, compute_type)
+    transcribe_like_service(whisper, corpus[0]["waveform"], {})  # warm-up
+
+    print(f"{len(corpus)} clips, {audio_seconds:.1f}s audio  |  tier={args.tier} ({size}:{compute_type})\n")
+    print(f"  {'Profile':<10}  {'WER':>7}  {'RTF':>7}  {'avg ms':>8}  {'p50 ms':>8}")
+    print(f"  {'-'*10}  {'-'*7}  {'-'*7}  {'-'*8}  {'-'*8}")
+    results = []
+    for profile in args.profiles.split(","):
+        result = run_profile(whisper, corpus, profile)
+        results.append(result)
+        print(f"  {profile:<10}  {result['wer']:>7.2%}  {result['rtf']:>7.3f}  "
+              f"{result['avg_latency_ms']:>8.1f}  {result['p50_latency_ms']:>8.1f}")
+
+    if args.json:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "corpus": args.corpus,
+            "clips": len(corpus),
+            "audio_seconds": round(audio_seconds, 2),
+            "tier": args.tier,
+            "model": f"{size}:{compute_type}",
+            "profiles": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nJSON report: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
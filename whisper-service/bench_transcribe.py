@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+/transcribe throughput and real-time-factor benchmark, in-process.
+
+Builds a corpus of clips of varied length, then drives the FastAPI app
+through httpx's ASGI transport (no server, no network) at each concurrency
+level and reports per level:
+
+  - real-time factor (processing s / audio s, per request and overall)
+  - p50/p95/p99 latency and throughput (requests/s and audio s per wall s)
+  - peak RSS while the level ran
+  - WER against the reference text, where the clip has one
+  - 429s from admission control (WHISPER_MAX_PENDING), which are not retried
+
+Corpus, in order of preference:
+  --corpus DIR   audio files with same-stem .txt references (the layout of
+                 bench_decode.py; .question.txt / .answer.txt are sent as
+                 questionText / correctAnswer)
+  espeak-ng      spoken synthetic answers of 2-20 s with known text, when
+                 espeak-ng (or espeak) is on PATH; --save-corpus DIR keeps
+                 them in the --corpus layout for later runs
+  tone bursts    3-20 s clips without references: timings only, WER is null
+
+  python bench_transcribe.py                                # levels 1,2,4,8
+  python bench_transcribe.py --levels 1,2,4 --rounds 3 --tier accurate
+  python bench_transcribe.py --corpus ./answers --profile fast --json report.json
+
+The transcript cache is disabled so every request decodes. The JSON report
+follows grading_eval_report.json (timestamp, setup, then one entry per
+level with "metrics" and "per_case"), so two runs can be diffed.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+
+# Every request has to decode; set before app reads its configuration
+os.environ["WHISPER_CACHE_MAX_ENTRIES"] = "0"
+os.environ["WHISPER_CACHE_DIR"] = ""
+
+import httpx
+import numpy as np
+
+import app
+from bench_batch import synthetic_clips
+from bench_decode import load_corpus, normalize_words, word_edits
+
+OUT_REPORT = "bench_transcribe_report.json"
+
+# Short quiz answers of increasing length, spoken by espeak-ng at ~150 wpm
+SYNTHETIC_ANSWERS = [
+    "Hydrogen and oxygen.",
+    "The mitochondria is the powerhouse of the cell.",
+    "Photosynthesis turns light, water and carbon dioxide into glucose and oxygen.",
+    "Newton's second law says that force equals mass times acceleration.",
+    "The French Revolution began in seventeen eighty nine and ended the absolute monarchy in France.",
+    "An algorithm is a finite sequence of well defined steps that solves a problem or performs a computation.",
+    "DNA stands for deoxyribonucleic acid. It carries the genetic instructions of living organisms "
+    "and is made of two strands that form a double helix.",
+    "Supply and demand set the price in a market. When demand rises and supply stays the same, "
+    "the price goes up until buyers and sellers agree again.",
+    "The water cycle moves water through evaporation, condensation and precipitation. The sun heats "
+    "the oceans, the vapour rises and cools into clouds, and the water falls back as rain or snow.",
+    "A binary search tree keeps smaller keys in the left subtree and larger keys in the right subtree, "
+    "so a lookup only follows one path from the root and takes logarithmic time when the tree is balanced.",
+]
+
+
+def tts_command():
+    return shutil.which("espeak-ng") or shutil.which("espeak")
+
+
+def spoken_corpus(tts: str, save_dir=None) -> list[dict]:
+    """SYNTHETIC_ANSWERS read out by espeak-ng, as corpus entries with references."""
+    corpus = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, text in enumerate(SYNTHETIC_ANSWERS):
+            path = Path(save_dir or tmp) / f"synthetic_{i:02d}.wav"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            subprocess.run([tts, "-s", "150", "-w", str(path), text], check=True, capture_output=True)
+            if save_dir:
+                path.with_suffix(".txt").write_text(text + "\n", encoding="utf-8")
+            seconds = len(app.decode_audio(str(path), sampling_rate=app.SAMPLE_RATE)) / app.SAMPLE_RATE
+            corpus.append({"name": path.name, "audio": path.read_bytes(), "seconds": seconds,
+                           "reference": text, "question": None, "answer": None})
+    return corpus
+
+
+def wav_bytes(waveform) -> bytes:
+    """16 kHz mono float32 -> 16-bit PCM WAV, i.e. what an upload looks like."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(app.SAMPLE_RATE)
+        w.writeframes((np.clip(waveform, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def tone_corpus(count: int, seed: int) -> list[dict]:
+    return [{"name": f"tone_{i:02d}.wav", "audio": wav_bytes(clip), "seconds": len(clip) / app.SAMPLE_RATE,
+             "reference": None, "question": None, "answer": None}
+            for i, clip in enumerate(synthetic_clips(count, seed))]
+
+
+def build_corpus(args) -> tuple[list[dict], str]:
+    """Corpus entries {name, audio (upload bytes), seconds, reference, question, answer} and its source."""
+    if args.corpus:
+        corpus = []
+        for entry in load_corpus(args.corpus):
+            waveform = entry.pop("waveform")
+            corpus.append({**entry, "audio": (Path(args.corpus) / entry["name"]).read_bytes(),
+                           "seconds": len(waveform) / app.SAMPLE_RATE})
+        return corpus, "directory"
+    if tts_command():
+        return spoken_corpus(tts_command(), args.save_corpus), Path(tts_command()).name
+    # Tone bursts are not speech to Silero, so VAD would skip every decode
+    app.VAD_ENABLED = False
+    return tone_corpus(args.tone_clips, args.seed), "tone"
+
+
+class RssSampler:
+    """Highest current_rss_mb() seen while running, sampled every `interval` s."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = app.current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, app.current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, app.current_rss_mb())
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+async def transcribe_request(client: httpx.AsyncClient, entry: dict, args) -> dict:
+    data = {k: v for k, v in (("tier", args.tier), ("profile", args.profile),
+                              ("questionText", entry["question"]), ("correctAnswer", entry["answer"])) if v}
+    start = time.perf_counter()
+    response = await client.post("/transcribe", data=data,
+                                 files={"audio": (entry["name"], entry["audio"], "application/octet-stream")})
+    latency = time.perf_counter() - start
+    case = {"clip": entry["name"], "audio_seconds": round(entry["seconds"], 2),
+            "status": response.status_code, "latency_ms": round(latency * 1000, 2),
+            "rtf": round(latency / entry["seconds"], 4)}
+    if response.status_code == 200:
+        body = response.json()
+        case.update(text=body["text"], noSpeech=body["noSpeech"], avgLogprob=body.get("avgLogprob"))
+        if entry["reference"] is not None:
+            reference = normalize_words(entry["reference"])
+            case["edits"] = word_edits(reference, normalize_words(body["text"]))
+            case["reference_words"] = len(reference)
+            case["wer"] = round(case["edits"] / max(1, len(reference)), 4)
+    return case
+
+
+async def run_level(client: httpx.AsyncClient, corpus: list[dict], concurrency: int, args) -> dict:
+    """Every clip `rounds` times, `concurrency` requests in flight."""
+    queue = asyncio.Queue()
+    for _ in range(args.rounds):
+        for entry in corpus:
+            queue.put_nowait(entry)
+    cases = []
+
+    async def worker():
+        while not queue.empty():
+            cases.append(await transcribe_request(client, queue.get_nowait(), args))
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = [c for c in cases if c["status"] == 200]
+    latencies = [c["latency_ms"] for c in ok]
+    audio_seconds = sum(c["audio_seconds"] for c in ok)
+    scored = [c for c in ok if "wer" in c]
+    metrics = {
+        "requests": len(cases),
+        "completed": len(ok),
+        "rejected_429": sum(1 for c in cases if c["status"] == 429),
+        "errors": sum(1 for c in cases if c["status"] not in (200, 429)),
+        "wall_seconds": round(wall, 3),
+        "audio_seconds": round(audio_seconds, 2),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "audio_seconds_per_second": round(audio_seconds / wall, 3) if wall else 0.0,
+        "rtf": round(sum(latencies) / 1000 / audio_seconds, 4) if audio_seconds else None,
+        "p50_rtf": round(percentile([c["rtf"] for c in ok], 50), 4),
+        "avg_latency_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "p50_latency_ms": round(percentile(latencies, 50), 2),
+        "p95_latency_ms": round(percentile(latencies, 95), 2),
+        "p99_latency_ms": round(percentile(latencies, 99), 2),
+        "peak_rss_mb": round(rss.peak, 1),
+        "wer": (round(sum(c["edits"] for c in scored) / max(1, sum(c["reference_words"] for c in scored)), 4)
+                if scored else None),
+    }
+    return {"concurrency": concurrency, "metrics": metrics, "per_case": cases}
+
+
+async def run(corpus: list[dict], levels: list[int], args) -> dict:
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Loads the tier's model outside the measured levels
+        await transcribe_request(client, corpus[0], args)
+        results = {}
+        for concurrency in levels:
+            results[str(concurrency)] = await run_level(client, corpus, concurrency, args)
+            m = results[str(concurrency)]["metrics"]
+            wer = f"{m['wer']:>6.1%}" if m["wer"] is not None else f"{'-':>6}"
+            print(f"  {concurrency:>4}  {m['completed']:>4}/{m['requests']:<4}  {m['throughput_rps']:>7.2f}  "
+                  f"{m['rtf']:>6.3f}  {m['p50_latency_ms']:>8.1f}  {m['p95_latency_ms']:>8.1f}  "
+                  f"{m['p99_latency_ms']:>8.1f}  {m['peak_rss_mb']:>7.1f}  {wer}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of audio + .txt reference pairs")
+    parser.add_argument("--save-corpus", metavar="DIR", help="keep the espeak-ng corpus here")
+    parser.add_argument("--tone-clips", type=int, default=10, help="tone clips when there is no TTS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=1, help="passes over the corpus per level")
+    parser.add_argument("--tier", default=None, choices=sorted(app.MODEL_TIERS))
+    parser.add_argument("--profile", default=None, choices=sorted(app.DECODE_PROFILES))
+    parser.add_argument("--json", default=OUT_REPORT, help=f"report path (default: {OUT_REPORT})")
+    args = parser.parse_args()
+
+    corpus, source = build_corpus(args)
+    if not corpus:
+        parser.error(f"no audio files with .txt references in {args.corpus}")
+    levels = [int(n) for n in args.levels.split(",")]
+    tier = args.tier or app.DEFAULT_TIER
+    size, compute_type = app.MODEL_TIERS[tier]
+    audio_seconds = sum(entry["seconds"] for entry in corpus)
+
+    print(f"{len(corpus)} clips ({source}), {audio_seconds:.1f}s audio  |  tier={tier} ({size}:{compute_type})  "
+          f"profile={args.profile or app.DEFAULT_PROFILE}  workers={app.NUM_WORKERS}  "
+          f"max_pending={app.MAX_PENDING}  cpu_threads={app.CPU_THREADS or 'default'}\n")
+    print(f"  {'conc':>4}  {'ok/sent':>9}  {'req/s':>7}  {'RTF':>6}  {'p50 ms':>8}  {'p95 ms':>8}  "
+          f"{'p99 ms':>8}  {'RSS MB':>7}  {'WER':>6}")
+    print(f"  {'-'*4}  {'-'*9}  {'-'*7}  {'-'*6}  {'-'*8}  {'-'*8}  {'-'*8}  {'-'*7}  {'-'*6}")
+    levels_report = asyncio.run(run(corpus, levels, args))
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "corpus": {"source": args.corpus or source, "clips": len(corpus),
+                   "audio_seconds": round(audio_seconds, 2),
+                   "with_reference": sum(1 for entry in corpus if entry["reference"] is not None)},
+        "tier": tier,
+        "model": f"{size}:{compute_type}",
+        "profile": args.profile or app.DEFAULT_PROFILE,
+        "vad": app.VAD_ENABLED,
+        "workers": app.NUM_WORKERS,
+        "cpu_threads": app.CPU_THREADS,
+        "max_pending": app.MAX_PENDING,
+        "rounds": args.rounds,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "levels": levels_report,
+    }
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nSaved: {args.json}")
+
+
+if __name__ == "__main__":
+    main()